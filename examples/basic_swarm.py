@@ -4,33 +4,30 @@ Demonstrates CRDT convergence across agents with concurrent writes.
 """
 
 import asyncio
-from plutus import PlutusAgent, LifecycleEvent
+from plutus import PlutusAgent, PlutusDoc
 
 
 async def main():
-    # Create three agents sharing state via CRDT
+    # Planner joins first (local mode, no server) and creates tasks
     planner = PlutusAgent(name="planner", peer_id=1)
-    worker = PlutusAgent(name="worker", peer_id=2)
-    reviewer = PlutusAgent(name="reviewer", peer_id=3)
+    await planner.join()
+    print(f"[{planner.name}] joined (peer_id={planner.peer_id})")
 
-    agents = [planner, worker, reviewer]
-
-    # Join all agents (local mode, no server)
-    for agent in agents:
-        await agent.join()
-        print(f"[{agent.name}] joined (peer_id={agent.peer_id})")
-
-    # Planner creates tasks
     planner.state("tasks").set("task_1", {"desc": "Design API", "status": "pending"})
     planner.state("tasks").set("task_2", {"desc": "Write tests", "status": "pending"})
     planner.state("tasks").set("task_3", {"desc": "Deploy", "status": "pending"})
     planner.commit()
     print(f"\n[planner] Created 3 tasks")
 
-    # Sync planner's state to others via export/import
-    updates = planner.doc.export_snapshot()
-    worker.doc.import_updates(updates)
-    reviewer.doc.import_updates(updates)
+    # Worker and reviewer start from a fork of the planner's doc instead of
+    # importing an exported copy of its state
+    worker = PlutusAgent(name="worker", doc=PlutusDoc.fork_from(planner.doc, peer_id=2))
+    reviewer = PlutusAgent(name="reviewer", doc=PlutusDoc.fork_from(planner.doc, peer_id=3))
+    for agent in (worker, reviewer):
+        await agent.join()
+        print(f"[{agent.name}] joined (peer_id={agent.peer_id})")
+
+    agents = [planner, worker, reviewer]
 
     # Worker picks up task_1 and marks it in progress
     worker.state("tasks").set("task_1", {"desc": "Design API", "status": "in_progress", "assignee": "worker"})
@@ -44,26 +41,24 @@ async def main():
 
     # Sync all states — CRDT handles conflict-free merge
     # Worker → Planner and Reviewer
-    worker_updates = worker.doc.export_snapshot()
+    worker_updates = worker.export_delta()
     planner.doc.import_updates(worker_updates)
     reviewer.doc.import_updates(worker_updates)
 
     # Reviewer → Planner and Worker
-    reviewer_updates = reviewer.doc.export_snapshot()
+    reviewer_updates = reviewer.export_delta()
     planner.doc.import_updates(reviewer_updates)
     worker.doc.import_updates(reviewer_updates)
 
     # All agents now see the merged state
     print(f"\n--- Final State (all agents converged) ---")
     for agent in agents:
-        state = agent.doc.get_deep_value()
         print(f"\n[{agent.name}] state:")
-        for ns_name, ns_data in state.items():
-            print(f"  {ns_name}: {ns_data}")
+        for ns_name, ns in agent.doc.iter_namespaces():
+            print(f"  {ns_name}: {dict(ns.items())}")
 
-    # Verify convergence
-    states = [a.doc.get_deep_value() for a in agents]
-    assert states[0] == states[1] == states[2], "States diverged!"
+    # Verify convergence: equal version vectors imply equal state
+    assert len({a.doc.state_fingerprint() for a in agents}) == 1, "States diverged!"
     print(f"\nAll 3 agents converged to identical state!")
 
     # Worker completes task_1
@@ -71,7 +66,7 @@ async def main():
     worker.commit()
 
     # Sync final update
-    final = worker.doc.export_snapshot()
+    final = worker.export_delta()
     planner.doc.import_updates(final)
     reviewer.doc.import_updates(final)
 
@@ -4,7 +4,7 @@ Run this script to see two agents exchange state through a central hub.
 """
 
 import anyio
-from plutus import PlutusAgent
+from plutus import PlutusAgent, Shard
 from plutus.infra.daemon import SyncDaemon
 
 
@@ -21,6 +21,18 @@ async def run_agent(
     await anyio.sleep(delay)  # stagger connections
 
     agent = PlutusAgent(name=name, peer_id=peer_id)
+
+    # Track expected keys incrementally from change events instead of polling.
+    seen: set[str] = set()
+    converged = anyio.Event()
+
+    def on_shared_change(key: str, _value) -> None:
+        if key in expected_keys:
+            seen.add(key)
+            if seen == expected_keys:
+                converged.set()
+
+    agent.register_shard(Shard("shared"), on_shared_change)
     await agent.join(server_uri=f"ws://localhost:{port}")
     print(f"[{name}] connected to daemon")
     await anyio.sleep(settle_before_write)
@@ -33,11 +45,7 @@ async def run_agent(
 
     # Wait for remote updates to arrive automatically.
     with anyio.fail_after(5):
-        while True:
-            shared = agent.state("shared").to_dict()
-            if expected_keys.issubset(shared.keys()):
-                break
-            await anyio.sleep(0.05)
+        await converged.wait()
     print(f"[{name}] observed remote updates automatically")
 
     state = agent.doc.get_deep_value()
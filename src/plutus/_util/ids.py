@@ -3,9 +3,22 @@
 from __future__ import annotations
 
 import os
-import struct
+import random
+
+# Peer IDs only need to be unique, not unpredictable: seed a fast PRNG from the
+# OS entropy pool once instead of issuing a urandom syscall per ID.
+_RNG = random.Random(os.urandom(16))
+
+
+def _reseed() -> None:
+    _RNG.seed(os.urandom(16))
+
+
+if hasattr(os, "register_at_fork"):
+    # Forked children would otherwise replay the parent's sequence.
+    os.register_at_fork(after_in_child=_reseed)
 
 
 def generate_peer_id() -> int:
     """Generate a random 64-bit unsigned peer ID."""
-    return struct.unpack("!Q", os.urandom(8))[0]
+    return _RNG.getrandbits(64)
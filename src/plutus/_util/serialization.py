@@ -1,17 +1,48 @@
-"""Msgpack serialization helpers."""
+"""Msgpack serialization helpers.
+
+Uses ``ormsgpack`` (Rust) when the ``fast`` extra is installed and falls back
+to ``msgpack`` otherwise. Both produce the same wire format.
+"""
 
 from __future__ import annotations
 
+import threading
 from typing import Any
 
 import msgpack  # type: ignore[import-untyped]
 
+try:
+    import ormsgpack  # type: ignore[import-not-found,unused-ignore]
+except ImportError:
+    _HAS_ORMSGPACK = False
+else:
+    _HAS_ORMSGPACK = True
+
+
+if _HAS_ORMSGPACK:
+    _ORMSGPACK_OPTS = ormsgpack.OPT_NON_STR_KEYS
+
+    def pack(obj: Any) -> bytes:
+        """Serialize an object to msgpack bytes."""
+        return ormsgpack.packb(obj, option=_ORMSGPACK_OPTS)
+
+    def unpack(data: bytes | memoryview) -> Any:
+        """Deserialize msgpack bytes to an object."""
+        return ormsgpack.unpackb(data, option=_ORMSGPACK_OPTS)
 
-def pack(obj: Any) -> bytes:
-    """Serialize an object to msgpack bytes."""
-    return msgpack.packb(obj, use_bin_type=True)
+else:
+    # packb() builds a fresh Packer per call; for small envelopes that setup
+    # dominates, so each thread keeps one (pack() resets it after every call).
+    _tls = threading.local()
 
+    def pack(obj: Any) -> bytes:
+        """Serialize an object to msgpack bytes."""
+        try:
+            packer = _tls.packer
+        except AttributeError:
+            packer = _tls.packer = msgpack.Packer(use_bin_type=True)
+        return packer.pack(obj)
 
-def unpack(data: bytes) -> Any:
-    """Deserialize msgpack bytes to an object."""
-    return msgpack.unpackb(data, raw=False)
+    def unpack(data: bytes | memoryview) -> Any:
+        """Deserialize msgpack bytes to an object."""
+        return msgpack.unpackb(data, raw=False)
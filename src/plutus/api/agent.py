@@ -6,6 +6,7 @@ import asyncio
 import logging
 from typing import Any
 
+import anyio
 from loro import VersionVector
 
 from plutus.core.document import Namespace, PlutusDoc
@@ -22,6 +23,9 @@ from plutus.api.lifecycle import LifecycleEvent, LifecycleManager
 
 logger = logging.getLogger(__name__)
 
+# Per-type cache of whether map-delta entries wrap their payload in ``.value``.
+_HAS_VALUE_ATTR: dict[type, bool] = {}
+
 
 class PlutusAgent:
     """Primary user-facing class for Plutus agents.
@@ -47,9 +51,19 @@ class PlutusAgent:
         self._receive_task: asyncio.Task[None] | None = None
         self._send_task: asyncio.Task[None] | None = None
         self._last_synced_vv: VersionVector = self._plutus_doc.store.clone_oplog_vv()
+        # export_delta() keeps its own watermark so manual exports never hide
+        # ops from sync()'s broadcast, and vice versa.
+        self._last_exported_vv: VersionVector = self._plutus_doc.store.clone_oplog_vv()
         self._server_uri: str | None = None
         self._auth_token: str | None = None
         self._auto_reconnect = auto_reconnect
+        # Set by commit(); lets sync() skip idle ticks without cloning the VV.
+        self._dirty = False
+        # Set on every store change; wait_for_update() replaces it after waking.
+        # Creating it outside a running loop needs anyio>=4.2.
+        self._updated = anyio.Event()
+        # Loop that owns _updated; commits from other threads wake it through here.
+        self._loop: asyncio.AbstractEventLoop | None = None
 
     @property
     def peer_id(self) -> int:
@@ -77,23 +91,50 @@ class PlutusAgent:
     def register_shard(self, shard: Shard, callback: Any) -> None:
         self._shards.register(shard, callback)
 
-    @staticmethod
-    def _vv_equal(a: VersionVector, b: VersionVector) -> bool:
-        return a.includes_vv(b) and b.includes_vv(a)
-
     def _dispatch_changed_shards(self, diff_event: Any) -> None:
-        for event in getattr(diff_event, "events", []):
-            delta = getattr(getattr(event, "diff", None), "diff", None)
-            updated = getattr(delta, "updated", None)
-            if not isinstance(updated, dict):
+        if self._shards.is_empty:
+            return
+        dispatch = self._shards.dispatch
+        has_value = _HAS_VALUE_ATTR
+        try:
+            events = diff_event.events
+        except AttributeError:
+            return
+        for event in events:
+            # Only map diffs carry ``updated``; list/text/counter diffs are skipped.
+            try:
+                updated = event.diff.diff.updated
+            except AttributeError:
+                continue
+            if updated.__class__ is not dict:
                 continue
-            for key, value_or_container in updated.items():
-                value = getattr(value_or_container, "value", value_or_container)
-                self._shards.dispatch(str(key), value)
+            for key, value in updated.items():
+                cls = value.__class__
+                unwrap = has_value.get(cls)
+                if unwrap is None:
+                    unwrap = has_value[cls] = hasattr(value, "value")
+                dispatch(key if key.__class__ is str else str(key), value.value if unwrap else value)
+
+    def _notify_updated(self) -> None:
+        self._updated.set()
 
     def _on_store_change(self, diff_event: Any) -> None:
+        # anyio events are not thread-safe; with allow_multithreading a commit
+        # on another thread hands the wake-up to the agent's loop.
+        loop = self._loop
+        try:
+            on_loop = loop is None or asyncio.get_running_loop() is loop
+        except RuntimeError:
+            on_loop = False
+        if on_loop:
+            self._notify_updated()
+        elif loop is not None and not loop.is_closed():
+            loop.call_soon_threadsafe(self._notify_updated)
+        # Runs on every commit, including sync()'s own; bail out cheaply when
+        # no shard or ON_STATE_CHANGE hook is listening.
         self._dispatch_changed_shards(diff_event)
-        self._lifecycle.fire(LifecycleEvent.ON_STATE_CHANGE, self, diff_event)
+        if self._lifecycle.has_hooks(LifecycleEvent.ON_STATE_CHANGE):
+            self._lifecycle.fire(LifecycleEvent.ON_STATE_CHANGE, self, diff_event)
 
     async def _start_broadcaster_tasks(self) -> None:
         if self._broadcaster is None:
@@ -130,13 +171,7 @@ class PlutusAgent:
             return False
 
         logger.info("attempting transport reconnect for agent %s", self.name)
-        await self._stop_broadcaster_tasks()
-        if self._transport:
-            try:
-                await self._transport.close()
-            except Exception:
-                logger.debug("transport close failed during reconnect", exc_info=True)
-
+        old_transport = self._transport
         self._transport = await WebSocketTransport.connect(
             self._server_uri,
             peer_id=self.peer_id,
@@ -149,15 +184,23 @@ class PlutusAgent:
             )
             self._broadcaster.start_local_subscription()
         else:
+            # Running loops pick up the new transport; no task teardown needed.
             self._broadcaster.bind_transport(self._transport)
+        if old_transport is not None:
+            try:
+                await old_transport.close()
+            except Exception:
+                logger.debug("transport close failed during reconnect", exc_info=True)
 
+        # Only restarts loops that have exited.
         await self._start_broadcaster_tasks()
 
         join_envelope = Envelope(
             msg_type=MessageType.JOIN,
             sender=self.peer_id,
             target=None,
-            payload=b"",
+            # Our version vector lets the hub reply with just the ops we are missing.
+            payload=self._plutus_doc.store.clone_oplog_vv().encode(),
         )
         await self._transport.send(join_envelope)
         self._last_synced_vv = self._plutus_doc.store.clone_oplog_vv()
@@ -167,6 +210,7 @@ class PlutusAgent:
     async def join(self, server_uri: str | None = None, *, auth_token: str | None = None) -> None:
         """Join the swarm, optionally connecting to a sync server."""
         await self._lifecycle.fire_async(LifecycleEvent.BEFORE_JOIN, self)
+        self._loop = asyncio.get_running_loop()
         self._plutus_doc.store.on_change(self._on_store_change)
 
         if server_uri:
@@ -188,7 +232,7 @@ class PlutusAgent:
                 msg_type=MessageType.JOIN,
                 sender=self.peer_id,
                 target=None,
-                payload=b"",
+                payload=self._plutus_doc.store.clone_oplog_vv().encode(),
             )
             await self._transport.send(join_envelope)
             self._last_synced_vv = self._plutus_doc.store.clone_oplog_vv()
@@ -201,6 +245,9 @@ class PlutusAgent:
         await self._lifecycle.fire_async(LifecycleEvent.BEFORE_LEAVE, self)
 
         if self._transport:
+            if self._broadcaster:
+                # Drain queued updates first so peers see them before LEAVE.
+                await self._broadcaster.flush(timeout=1.0)
             leave_envelope = Envelope(
                 msg_type=MessageType.LEAVE,
                 sender=self.peer_id,
@@ -212,7 +259,6 @@ class PlutusAgent:
             except Exception:
                 pass
             if self._broadcaster:
-                await self._broadcaster.flush_pending(timeout=1.0)
                 self._broadcaster.stop()
             await self._stop_broadcaster_tasks()
             await self._transport.close()
@@ -224,29 +270,75 @@ class PlutusAgent:
 
     async def sync(self) -> None:
         """Commit local changes and broadcast to peers."""
-        if self._broadcaster and self._transport:
-            self._broadcaster.suppress_next_local_update()
-        self._plutus_doc.commit()
+        store = self._plutus_doc.store
+        has_pending = store.has_pending_changes()
+        # Commits made outside commit() (doc.commit(), synced descriptors,
+        # commit_soon) only mark us dirty if the broadcaster had to drop them.
+        if self._broadcaster is not None and self._broadcaster.take_dropped_local_update():
+            self._dirty = True
+        if not (has_pending or self._dirty):
+            # Idle tick: nothing written or dropped since the last sync, skip the export.
+            return
+
+        if has_pending:
+            # Only suppress when this commit will actually emit a local update.
+            if self._broadcaster and self._transport:
+                self._broadcaster.suppress_next_local_update()
+            self._plutus_doc.commit()
 
         if self._broadcaster and self._transport:
             if not self._transport.is_connected:
                 await self._reconnect_transport()
+            # A send_loop that exited on a send error left its batch queued; restart it.
+            await self._start_broadcaster_tasks()
 
-            current_vv = self._plutus_doc.store.clone_oplog_vv()
-            if self._vv_equal(current_vv, self._last_synced_vv):
-                return
-            updates = self._plutus_doc.store.export_updates(since=self._last_synced_vv)
-            try:
-                await self._broadcaster.broadcast_update(updates)
-            except Exception:
-                if not await self._reconnect_transport():
-                    raise
-                await self._broadcaster.broadcast_update(updates)
-            self._last_synced_vv = current_vv
+            updates, current_vv = store.export_updates_with_vv(since=self._last_synced_vv)
+            if current_vv != self._last_synced_vv:
+                # Enqueue rather than send: send_loop coalesces bursts into one frame.
+                if self._broadcaster.enqueue_update(updates):
+                    self._last_synced_vv = current_vv
+                elif not self._broadcaster.closed:
+                    # Queue full: keep the watermark and mark the agent dirty so
+                    # the next sync() exports these ops again once send_loop catches up.
+                    logger.warning("broadcast queue full for agent %s; deferring sync", self.name)
+                    self._dirty = True
+                    return
+                else:
+                    if not await self._reconnect_transport():
+                        raise ConnectionError("failed to queue CRDT update for broadcast")
+                    await self._broadcaster.broadcast_update(updates)
+                    self._last_synced_vv = current_vv
+        self._dirty = False
+
+    async def wait_for_update(self, timeout: float | None = None) -> None:
+        """Wait until the store changes (local commit or remote import) while joined.
+
+        Changes that landed since the previous call return immediately, so a
+        ``while not condition: await agent.wait_for_update()`` loop never misses one.
+        Raises TimeoutError after ``timeout`` seconds. Commits from other threads
+        wake the waiter through the event loop.
+        """
+        with anyio.fail_after(timeout):
+            await self._updated.wait()
+        self._updated = anyio.Event()
 
     def commit(self) -> None:
         """Commit local changes (broadcasts automatically when connected)."""
         self._plutus_doc.commit()
+        self._dirty = True
+
+    def export_delta(self) -> bytes:
+        """Export ops committed since the previous ``export_delta()`` call.
+
+        Cost scales with the number of new ops rather than the whole history; use
+        ``doc.export_snapshot()`` only to bootstrap a peer joining from scratch.
+        The watermark is separate from the one :meth:`sync` broadcasts from, so
+        mixing the two never drops ops from either stream.
+        """
+        updates, self._last_exported_vv = self._plutus_doc.store.export_updates_with_vv(
+            since=self._last_exported_vv
+        )
+        return updates
 
     def on(self, event: LifecycleEvent, hook: Any) -> None:
         self._lifecycle.on(event, hook)
@@ -2,11 +2,14 @@
 
 from __future__ import annotations
 
+import inspect
 import logging
+from contextlib import contextmanager
 from dataclasses import dataclass, field
-from typing import Any, Callable
+from typing import Any, Callable, Iterator, cast
 
 import anyio
+from loro import LoroList
 
 from plutus.core.document import PlutusDoc
 
@@ -18,6 +21,10 @@ class BlueprintNode:
     name: str
     handler: Callable[[BlueprintContext], Any]
     metadata: dict[str, Any] = field(default_factory=dict)
+    is_async: bool = field(init=False)
+
+    def __post_init__(self) -> None:
+        self.is_async = inspect.iscoroutinefunction(self.handler)
 
 
 @dataclass
@@ -33,36 +40,74 @@ class BlueprintContext:
     def __init__(self, doc: PlutusDoc) -> None:
         self._doc = doc
         self._ns = doc.namespace("blueprint")
+        self._ns_get = self._ns.get
+        self._ns_set = self._ns.set
+        self._pending: dict[str, Any] | None = None
+        self._history: LoroList | None = None
 
     @property
     def doc(self) -> PlutusDoc:
         return self._doc
 
     def get(self, key: str, default: Any = None) -> Any:
-        return self._ns.get(key, default)
+        if self._pending is not None and key in self._pending:
+            return self._pending[key]
+        return self._ns_get(key, default)
 
     def set(self, key: str, value: Any) -> None:
-        self._ns.set(key, value)
+        if self._pending is None:
+            self._ns_set(key, value)
+            return
+        self._pending[key] = self._ns.validate_value(key, value)
+
+    @contextmanager
+    def batch(self) -> Iterator[BlueprintContext]:
+        """Stage set() calls locally and write them to the namespace once on exit."""
+        if self._pending is not None:
+            yield self
+            return
+        self._pending = {}
+        try:
+            yield self
+        finally:
+            pending, self._pending = self._pending, None
+            if pending:
+                self._ns.update(pending)
 
     @property
     def current_node(self) -> str | None:
-        return self._ns.get("_current_node")
+        return self._ns_get("_current_node")
 
     @current_node.setter
     def current_node(self, value: str) -> None:
-        self._ns.set("_current_node", value)
+        self._ns_set("_current_node", value)
 
     @property
     def completed(self) -> bool:
-        return self._ns.get("_completed", False)
+        return self._ns_get("_completed", False)
 
     @completed.setter
     def completed(self, value: bool) -> None:
-        self._ns.set("_completed", value)
+        self._ns_set("_completed", value)
 
     @property
     def history(self) -> list[str]:
-        return self._ns.get("_history", [])
+        value = self._ns_get("_history")
+        if value is None:
+            return []
+        if isinstance(value, list):
+            # Written as a plain value by older versions.
+            return value
+        return cast(list[str], self._ns.get_list("_history").get_deep_value())
+
+    def reset_history(self) -> None:
+        self._history = self._ns.get_list("_history", reset=True)
+
+    def append_history(self, node_name: str) -> None:
+        """Push one node name onto the CRDT-backed history list."""
+        if self._history is None:
+            self._history = self._ns.get_list("_history")
+        self._history.push(node_name)
 
 
 class Blueprint:
@@ -75,6 +120,7 @@ class Blueprint:
         self.name = name
         self._nodes: dict[str, BlueprintNode] = {}
         self._transitions: list[BlueprintTransition] = []
+        self._out: dict[str, list[BlueprintTransition]] = {}
         self._entry_node: str | None = None
 
     def add_node(
@@ -94,9 +140,9 @@ class Blueprint:
         to_node: str,
         condition: Callable[[BlueprintContext], bool] | None = None,
     ) -> Blueprint:
-        self._transitions.append(
-            BlueprintTransition(from_node=from_node, to_node=to_node, condition=condition)
-        )
+        trans = BlueprintTransition(from_node=from_node, to_node=to_node, condition=condition)
+        self._transitions.append(trans)
+        self._out.setdefault(from_node, []).append(trans)
         return self
 
     def set_entry(self, node_name: str) -> Blueprint:
@@ -105,8 +151,6 @@ class Blueprint:
 
     async def execute(self, doc: PlutusDoc | None = None, *, timeout: float | None = None) -> BlueprintContext:
         """Execute the blueprint state machine."""
-        import inspect
-
         doc = doc or PlutusDoc()
         ctx = BlueprintContext(doc)
 
@@ -114,7 +158,8 @@ class Blueprint:
             raise ValueError("No entry node defined")
 
         ctx.current_node = self._entry_node
-        history: list[str] = []
+        if not ctx.completed:
+            ctx.reset_history()
 
         while ctx.current_node and not ctx.completed:
             node_name = ctx.current_node
@@ -122,20 +167,22 @@ class Blueprint:
             if not node:
                 raise ValueError(f"Node '{node_name}' not found")
 
-            history.append(node_name)
-            ctx.set("_history", history)
+            ctx.append_history(node_name)
 
-            async def run_node() -> None:
-                result = node.handler(ctx)
-                if inspect.isawaitable(result):
-                    await result
+            async def run_node(node: BlueprintNode) -> None:
+                # Handler writes are staged and flushed once per node; the
+                # _current_node/_history bookkeeping stays outside the batch.
+                with ctx.batch():
+                    result = node.handler(ctx)
+                    if node.is_async or (result is not None and inspect.isawaitable(result)):
+                        await result
 
             try:
                 if timeout is None:
-                    await run_node()
+                    await run_node(node)
                 else:
                     with anyio.fail_after(timeout):
-                        await run_node()
+                        await run_node(node)
             except TimeoutError as exc:
                 logger.warning("blueprint node timed out: %s (timeout=%ss)", node_name, timeout)
                 raise TimeoutError(
@@ -146,11 +193,10 @@ class Blueprint:
 
             # Find next transition
             next_node = None
-            for trans in self._transitions:
-                if trans.from_node == node_name:
-                    if trans.condition is None or trans.condition(ctx):
-                        next_node = trans.to_node
-                        break
+            for trans in self._out.get(node_name, ()):
+                if trans.condition is None or trans.condition(ctx):
+                    next_node = trans.to_node
+                    break
 
             if next_node is None:
                 ctx.completed = True
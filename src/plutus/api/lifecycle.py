@@ -2,6 +2,7 @@
 
 from __future__ import annotations
 
+import inspect
 from enum import Enum, auto
 from typing import Any, Callable
 
@@ -24,25 +25,32 @@ class LifecycleManager:
     """Manages registration and firing of agent lifecycle hooks."""
 
     def __init__(self) -> None:
-        self._hooks: dict[LifecycleEvent, list[LifecycleHook]] = {}
+        # (hook, is_coroutine_function) pairs, classified once at registration.
+        self._hooks: dict[LifecycleEvent, list[tuple[LifecycleHook, bool]]] = {}
 
     def on(self, event: LifecycleEvent, hook: LifecycleHook) -> None:
-        self._hooks.setdefault(event, []).append(hook)
+        self._hooks.setdefault(event, []).append((hook, inspect.iscoroutinefunction(hook)))
 
     def off(self, event: LifecycleEvent, hook: LifecycleHook) -> None:
         hooks = self._hooks.get(event, [])
-        if hook in hooks:
-            hooks.remove(hook)
+        for i, (registered, _) in enumerate(hooks):
+            if registered == hook:
+                del hooks[i]
+                break
+
+    def has_hooks(self, event: LifecycleEvent) -> bool:
+        return bool(self._hooks.get(event))
 
     def fire(self, event: LifecycleEvent, *args: Any, **kwargs: Any) -> None:
-        for hook in self._hooks.get(event, []):
+        for hook, _ in self._hooks.get(event, []):
             hook(*args, **kwargs)
 
     async def fire_async(self, event: LifecycleEvent, *args: Any, **kwargs: Any) -> None:
-        import inspect
-        for hook in self._hooks.get(event, []):
+        for hook, is_async in self._hooks.get(event, []):
             result = hook(*args, **kwargs)
-            if inspect.isawaitable(result):
+            # Plain hooks almost always return None; only probe other results
+            # (e.g. a lambda returning a coroutine).
+            if is_async or (result is not None and inspect.isawaitable(result)):
                 await result
 
     def hook(self, event: LifecycleEvent) -> Callable[[LifecycleHook], LifecycleHook]:
@@ -28,15 +28,13 @@ class synced:
     def __get__(self, obj: Any, objtype: type | None = None) -> Any:
         if obj is None:
             return self
-        doc = obj._plutus_doc
-        ns = doc.namespace(self.ns)
-        val = ns.get(self.attr_name)
+        # PlutusDoc caches Namespace objects, so this is a dict hit per access.
+        val = obj._plutus_doc.namespace(self.ns).get(self.attr_name)
         return val if val is not None else self.default
 
     def __set__(self, obj: Any, value: Any) -> None:
         doc = obj._plutus_doc
-        ns = doc.namespace(self.ns)
-        ns.set(self.attr_name, value)
+        doc.namespace(self.ns).set(self.attr_name, value)
         if self.auto_commit:
             commit = getattr(obj, "commit", None)
             if callable(commit):
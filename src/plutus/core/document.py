@@ -5,12 +5,47 @@ from __future__ import annotations
 import logging
 from typing import Any, Iterator, cast
 
-from loro import LoroMap
+from loro import LoroList, LoroMap, VersionVector
 
-from plutus.core.store import CRDTStore
+from plutus.core.store import COMMIT_SOON_MAX_PENDING_OPS, CRDTStore
 
 logger = logging.getLogger(__name__)
 
+_SCALAR_TYPES = frozenset((bool, int, float, str, bytes, type(None)))
+
+
+class _UnsupportedValue(Exception):
+    pass
+
+
+def _validate_and_normalize(value: Any) -> Any:
+    """Validate and normalize a value in one walk (tuples become lists).
+
+    Raises _UnsupportedValue on the first value Loro cannot store.
+    """
+    value_type = type(value)
+    if value_type in _SCALAR_TYPES:
+        return value
+    if value_type is list or value_type is tuple:
+        return [_validate_and_normalize(v) for v in value]
+    if value_type is dict:
+        normalized = {}
+        for k, v in value.items():
+            if type(k) is not str:
+                raise _UnsupportedValue
+            normalized[k] = _validate_and_normalize(v)
+        return normalized
+    # Subclasses (IntEnum, OrderedDict, namedtuple, ...) take the slower isinstance path.
+    if isinstance(value, (bool, int, float, str, bytes)):
+        return value
+    if isinstance(value, (list, tuple)):
+        return [_validate_and_normalize(v) for v in value]
+    if isinstance(value, dict):
+        if not all(isinstance(k, str) for k in value):
+            raise _UnsupportedValue
+        return {k: _validate_and_normalize(v) for k, v in value.items()}
+    raise _UnsupportedValue
+
 
 class Namespace:
     """Typed dict-like access over a LoroMap within a PlutusDoc."""
@@ -32,29 +67,61 @@ class Namespace:
             return getattr(result, "value")
         return result
 
-    def set(self, key: str, value: Any) -> None:
-        if not self._is_supported_value(value):
+    @staticmethod
+    def _unwrap(result: Any) -> Any:
+        if hasattr(result, "value"):
+            return result.value
+        return result.container.get_deep_value()
+
+    def validate_value(self, key: str, value: Any) -> Any:
+        """Check that ``value`` can be stored at ``key`` and return its normalized form."""
+        try:
+            return _validate_and_normalize(value)
+        except _UnsupportedValue:
             raise TypeError(
                 f"unsupported value type for CRDT namespace '{self._name}.{key}': {type(value).__name__}"
-            )
-        normalized = self._normalize_value(value)
+            ) from None
+
+    def set(self, key: str, value: Any) -> None:
+        # Scalars (counters, flags, status strings) are the common write and
+        # need no normalization; only containers take the recursive walk.
+        normalized = value if type(value) in _SCALAR_TYPES else self.validate_value(key, value)
         try:
             self._map.insert(key, normalized)
         except Exception as exc:
             logger.exception("failed to write namespace key %s.%s", self._name, key)
             raise TypeError(f"failed to write CRDT value at '{self._name}.{key}'") from exc
 
+    def get_list(self, key: str, *, reset: bool = False) -> LoroList:
+        """Get or create an append-friendly CRDT list stored at ``key``.
+
+        ``reset=True`` replaces any existing value with a fresh empty list.
+        """
+        if reset:
+            return cast(LoroList, self._map.insert_container(key, LoroList()))
+        return cast(LoroList, self._map.get_or_create_container(key, LoroList()))
+
+    def update(self, values: dict[str, Any]) -> None:
+        """Write several keys in one call."""
+        for key, value in values.items():
+            self.set(key, value)
+
     def delete(self, key: str) -> None:
         self._map.delete(key)
 
     def keys(self) -> list[str]:
-        return list(self._map.keys())
+        # The binding already returns a fresh list; no extra copy needed.
+        return self._map.keys()
 
     def values(self) -> list[Any]:
-        return list(self._map.values())
+        unwrap = self._unwrap
+        return [unwrap(result) for result in self._map.values()]
 
-    def items(self) -> list[tuple[str, Any]]:
-        return list(self._map.items())
+    def items(self) -> Iterator[tuple[str, Any]]:
+        """Yield ``(key, value)`` pairs, materializing each value only as it is reached."""
+        unwrap = self._unwrap
+        for key, result in self._map.items():
+            yield key, unwrap(result)
 
     def to_dict(self) -> dict[str, Any]:
         return cast(dict[str, Any], self._map.get_deep_value())
@@ -78,36 +145,27 @@ class Namespace:
         return len(self._map)
 
     def __iter__(self) -> Iterator[str]:
-        return iter(self.keys())
-
-    @classmethod
-    def _is_supported_value(cls, value: Any) -> bool:
-        if value is None or isinstance(value, (bool, int, float, str, bytes)):
-            return True
-        if isinstance(value, (list, tuple)):
-            return all(cls._is_supported_value(v) for v in value)
-        if isinstance(value, dict):
-            return all(isinstance(k, str) and cls._is_supported_value(v) for k, v in value.items())
-        return False
-
-    @classmethod
-    def _normalize_value(cls, value: Any) -> Any:
-        if isinstance(value, tuple):
-            return [cls._normalize_value(v) for v in value]
-        if isinstance(value, list):
-            return [cls._normalize_value(v) for v in value]
-        if isinstance(value, dict):
-            return {k: cls._normalize_value(v) for k, v in value.items()}
-        return value
+        return iter(self._map.keys())
 
 
 class PlutusDoc:
     """High-level document wrapping a CRDTStore with namespace access."""
 
-    def __init__(self, store: CRDTStore | None = None, peer_id: int | None = None) -> None:
-        self._store = store or CRDTStore(peer_id=peer_id)
+    def __init__(
+        self,
+        store: CRDTStore | None = None,
+        peer_id: int | None = None,
+        *,
+        allow_multithreading: bool = True,
+    ) -> None:
+        self._store = store or CRDTStore(peer_id=peer_id, allow_multithreading=allow_multithreading)
         self._namespaces: dict[str, Namespace] = {}
 
+    @classmethod
+    def fork_from(cls, base: PlutusDoc, peer_id: int | None = None, *, shallow: bool = False) -> PlutusDoc:
+        """Create a doc seeded from ``base`` without an export/import round trip."""
+        return cls(store=base.store.fork(peer_id, shallow=shallow))
+
     @property
     def store(self) -> CRDTStore:
         return self._store
@@ -118,9 +176,15 @@ class PlutusDoc:
 
     def namespace(self, name: str) -> Namespace:
         """Get or create a namespace (backed by a LoroMap)."""
-        if name not in self._namespaces:
-            self._namespaces[name] = Namespace(self._store, name)
-        return self._namespaces[name]
+        ns = self._namespaces.get(name)
+        if ns is None:
+            ns = self._namespaces[name] = Namespace(self._store, name)
+        return ns
+
+    def iter_namespaces(self) -> Iterator[tuple[str, Namespace]]:
+        """Yield ``(name, namespace)`` for every root map without building the deep value."""
+        for name in self._store.root_map_names():
+            yield name, self.namespace(name)
 
     def state(self, name: str) -> Namespace:
         """Alias for namespace()."""
@@ -129,14 +193,28 @@ class PlutusDoc:
     def commit(self) -> None:
         self._store.commit()
 
+    def commit_soon(self, delay: float = 0.0, *, max_pending_ops: int = COMMIT_SOON_MAX_PENDING_OPS) -> None:
+        """Schedule a group commit; see :meth:`CRDTStore.commit_soon`."""
+        self._store.commit_soon(delay, max_pending_ops=max_pending_ops)
+
     def export_snapshot(self) -> bytes:
         return self._store.export_snapshot()
 
-    def export_updates(self) -> bytes:
-        return self._store.export_updates()
+    def export_updates(self, since: VersionVector | None = None) -> bytes:
+        """Export updates since ``since`` (all history when omitted)."""
+        return self._store.export_updates(since=since)
 
     def import_updates(self, data: bytes) -> None:
         self._store.import_updates(data)
 
     def get_deep_value(self) -> dict[str, Any]:
         return self._store.get_deep_value()
+
+    def state_fingerprint(self) -> tuple[tuple[int, int], ...]:
+        """Return a cheap comparable summary of the ops this doc has seen.
+
+        Docs with equal fingerprints hold the same ops and therefore converge to
+        the same state, so this avoids materializing the whole tree to compare.
+        """
+        spans = self._store.doc.oplog_vv.to_spans().inner()
+        return tuple(sorted((peer, end) for peer, (_, end) in spans.items()))
@@ -9,6 +9,41 @@ from plutus.core.types import Shard
 
 ShardCallback = Callable[[str, Any], None]
 
+# Bound on the memoized key -> callbacks index; cleared wholesale when exceeded.
+_MAX_INDEXED_KEYS = 4096
+
+# Trie node slot holding the shard names whose prefix ends at that node; never
+# collides with a child edge, which is always a single character.
+_NAMES = ""
+
+
+class _PrefixTrie:
+    """Character trie from shard prefixes to shard names."""
+
+    def __init__(self) -> None:
+        self._root: dict[str, Any] = {}
+
+    def add(self, prefix: str, name: str) -> None:
+        node = self._root
+        for ch in prefix:
+            node = node.setdefault(ch, {})
+        node.setdefault(_NAMES, set()).add(name)
+
+    def matches(self, key: str) -> set[str]:
+        """Return the names of every shard with a prefix of ``key``, in O(len(key))."""
+        node = self._root
+        # An empty prefix matches everything.
+        found: set[str] = set(node.get(_NAMES, ()))
+        for ch in key:
+            child = node.get(ch)
+            if child is None:
+                break
+            node = child
+            names = node.get(_NAMES)
+            if names:
+                found |= names
+        return found
+
 
 class ShardManager:
     """Manages shards and dispatches change events to matching shard callbacks."""
@@ -16,23 +51,55 @@ class ShardManager:
     def __init__(self) -> None:
         self._shards: dict[str, Shard] = {}
         self._callbacks: dict[str, list[ShardCallback]] = {}
+        self._by_key: dict[str, tuple[ShardCallback, ...]] = {}
+        self._trie = _PrefixTrie()
+        self._wildcard: set[str] = set()  # shards without prefixes match every key
+
+    def _rebuild_index(self) -> None:
+        self._by_key.clear()
+        self._trie = _PrefixTrie()
+        self._wildcard = set()
+        for shard in self._shards.values():
+            if not shard.prefixes:
+                self._wildcard.add(shard.name)
+            for prefix in shard.prefixes:
+                self._trie.add(prefix, shard.name)
 
     def register(self, shard: Shard, callback: ShardCallback) -> None:
         """Register a shard with a callback for matching changes."""
         self._shards[shard.name] = shard
         self._callbacks.setdefault(shard.name, []).append(callback)
+        self._rebuild_index()
 
     def unregister(self, shard_name: str) -> None:
         """Remove a shard and its callbacks."""
         self._shards.pop(shard_name, None)
         self._callbacks.pop(shard_name, None)
+        self._rebuild_index()
+
+    def callbacks_for(self, key: str) -> tuple[ShardCallback, ...]:
+        """Return the callbacks interested in ``key``, resolving shard matches once per key."""
+        callbacks = self._by_key.get(key)
+        if callbacks is None:
+            matched = self._trie.matches(key) | self._wildcard
+            # Walk shards in registration order so callback order stays stable.
+            callbacks = ()
+            if matched:
+                callbacks = tuple(
+                    cb
+                    for shard_name in self._shards
+                    if shard_name in matched
+                    for cb in self._callbacks.get(shard_name, [])
+                )
+            if len(self._by_key) >= _MAX_INDEXED_KEYS:
+                self._by_key.clear()
+            self._by_key[key] = callbacks
+        return callbacks
 
     def dispatch(self, key: str, value: Any) -> None:
         """Dispatch a change event to all shards whose prefixes match the key."""
-        for shard_name, shard in self._shards.items():
-            if shard.matches(key):
-                for cb in self._callbacks.get(shard_name, []):
-                    cb(key, value)
+        for cb in self.callbacks_for(key):
+            cb(key, value)
 
     def get_shard(self, name: str) -> Shard | None:
         return self._shards.get(name)
@@ -40,3 +107,7 @@ class ShardManager:
     @property
     def shard_names(self) -> list[str]:
         return list(self._shards.keys())
+
+    @property
+    def is_empty(self) -> bool:
+        return not self._shards
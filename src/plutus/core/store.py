@@ -2,22 +2,74 @@
 
 from __future__ import annotations
 
+import asyncio
+from contextlib import AbstractContextManager, nullcontext
 from threading import RLock
 from typing import Any, Callable, cast
 
-from loro import ExportMode, LoroCounter, LoroDoc, LoroList, LoroMap, LoroText, VersionVector
+from loro import (
+    ContainerType,
+    CounterSpan,
+    ExportMode,
+    IdSpan,
+    LoroCounter,
+    LoroDoc,
+    LoroList,
+    LoroMap,
+    LoroText,
+    VersionVector,
+)
+
+
+def is_decode_error(exc: BaseException) -> bool:
+    """Whether ``exc`` is how the Loro binding reports undecodable input.
+
+    The binding raises a bare ``BaseException`` (never a subclass) for bytes it
+    cannot decode; anything else is a real error and should propagate.
+    """
+    return type(exc) is BaseException
+
+
+# commit_soon() flushes early once the open transaction holds this many ops, so
+# a long write burst still goes out as several bounded updates instead of one.
+COMMIT_SOON_MAX_PENDING_OPS = 1000
+
+
+def decode_version_vector(data: bytes) -> VersionVector:
+    """Decode an encoded version vector, raising ValueError on malformed input."""
+    try:
+        return VersionVector.decode(data)
+    except BaseException as exc:
+        if not is_decode_error(exc):
+            raise
+        raise ValueError(f"invalid version vector: {exc}") from exc
 
 
 class CRDTStore:
     """Wraps a LoroDoc to provide a simplified CRDT state interface."""
 
-    def __init__(self, peer_id: int | None = None) -> None:
+    def __init__(self, peer_id: int | None = None, *, allow_multithreading: bool = True) -> None:
         self._doc = LoroDoc()
         if peer_id is not None:
             self._doc.peer_id = peer_id
-        self._lock = RLock()
+        # Read on every outgoing envelope; cached to skip the FFI getter.
+        self._peer_id: int = self._doc.peer_id
+        self._allow_multithreading = allow_multithreading
+        # Reads go straight to LoroDoc, which synchronizes internally; only
+        # mutations and exports serialize here. Reentrant because commit and
+        # import fire subscriber callbacks that may write back into the store.
+        # Stores opted out with allow_multithreading=False (event-loop-only use)
+        # skip locking entirely.
+        self._write_lock: AbstractContextManager[Any] = RLock() if allow_multithreading else nullcontext()
+        # Root container handles are stable, so repeat lookups are a dict hit.
+        self._maps: dict[str, LoroMap] = {}
+        self._lists: dict[str, LoroList] = {}
+        self._texts: dict[str, LoroText] = {}
+        self._counters: dict[str, LoroCounter] = {}
         self._local_update_sub: Any = None
         self._root_sub: Any = None
+        self._commit_handle: asyncio.TimerHandle | None = None
+        self._commit_loop: asyncio.AbstractEventLoop | None = None
 
     @property
     def doc(self) -> LoroDoc:
@@ -25,61 +77,198 @@ class CRDTStore:
 
     @property
     def peer_id(self) -> int:
-        return self._doc.peer_id
+        return self._peer_id
 
     def clone_oplog_vv(self) -> VersionVector:
         """Return a copy of the current oplog version vector."""
-        with self._lock:
-            return VersionVector.decode(self._doc.oplog_vv.encode())
+        # The binding already hands back an owned snapshot; no encode/decode needed.
+        return self._doc.oplog_vv
 
     def get_map(self, key: str) -> LoroMap:
-        with self._lock:
-            return self._doc.get_map(key)
+        handle = self._maps.get(key)
+        if handle is None:
+            handle = self._maps.setdefault(key, self._doc.get_map(key))
+        return handle
 
     def get_list(self, key: str) -> LoroList:
-        with self._lock:
-            return self._doc.get_list(key)
+        handle = self._lists.get(key)
+        if handle is None:
+            handle = self._lists.setdefault(key, self._doc.get_list(key))
+        return handle
 
     def get_text(self, key: str) -> LoroText:
-        with self._lock:
-            return self._doc.get_text(key)
+        handle = self._texts.get(key)
+        if handle is None:
+            handle = self._texts.setdefault(key, self._doc.get_text(key))
+        return handle
 
     def get_counter(self, key: str) -> LoroCounter:
-        with self._lock:
-            return self._doc.get_counter(key)
+        handle = self._counters.get(key)
+        if handle is None:
+            handle = self._counters.setdefault(key, self._doc.get_counter(key))
+        return handle
+
+    def fork(self, peer_id: int | None = None, *, shallow: bool = False) -> CRDTStore:
+        """Return an independent store seeded with this store's current state.
+
+        ``shallow=True`` drops history before the current frontiers, so the fork
+        only holds current state plus its own divergence. A shallow fork cannot
+        import ops that depend on the trimmed history (e.g. late concurrent edits).
+        """
+        with self._write_lock:
+            if shallow:
+                forked = LoroDoc()
+                forked.import_(self._doc.export(ExportMode.ShallowSnapshot(self._doc.oplog_frontiers)))
+            else:
+                forked = self._doc.fork()
+        store = CRDTStore(allow_multithreading=self._allow_multithreading)
+        store._doc = forked
+        if peer_id is not None:
+            forked.peer_id = peer_id
+        store._peer_id = forked.peer_id
+        return store
+
+    def has_pending_changes(self) -> bool:
+        """Whether the open transaction holds uncommitted local ops."""
+        return self._doc.get_pending_txn_len() > 0
 
     def commit(self) -> None:
-        with self._lock:
+        with self._write_lock:
+            handle, self._commit_handle = self._commit_handle, None
             self._doc.commit()
+        if handle is not None:
+            self._cancel_scheduled_commit(handle)
+
+    def commit_soon(self, delay: float = 0.0, *, max_pending_ops: int = COMMIT_SOON_MAX_PENDING_OPS) -> None:
+        """Group-commit: fold writes from the running event loop into one transaction.
+
+        Schedules a single commit ``delay`` seconds out (later calls join it), or
+        commits at once when the open transaction already holds
+        ``max_pending_ops`` ops. :meth:`commit` flushes any scheduled commit and
+        may be called from any thread. The timer needs the asyncio backend;
+        calling this without a running asyncio loop (including under trio)
+        raises RuntimeError.
+        """
+        if self._doc.get_pending_txn_len() >= max_pending_ops:
+            self.commit()
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            raise RuntimeError(
+                "commit_soon() requires a running asyncio event loop; use commit() instead"
+            ) from None
+        with self._write_lock:
+            if self._commit_handle is None:
+                self._commit_loop = loop
+                self._commit_handle = loop.call_later(delay, self._scheduled_commit)
+
+    def _cancel_scheduled_commit(self, handle: asyncio.TimerHandle) -> None:
+        # Timer handles belong to their loop; a commit() from a worker thread
+        # (allow_multithreading=True) hands the cancel over instead of racing it.
+        loop = self._commit_loop
+        if loop is None:
+            return
+        try:
+            on_loop = asyncio.get_running_loop() is loop
+        except RuntimeError:
+            on_loop = False
+        if on_loop:
+            handle.cancel()
+        elif not loop.is_closed():
+            loop.call_soon_threadsafe(handle.cancel)
+
+    def _scheduled_commit(self) -> None:
+        self.commit()
 
     def export_snapshot(self) -> bytes:
-        with self._lock:
+        with self._write_lock:
             return self._doc.export(ExportMode.Snapshot())
 
-    def export_updates(self, since: VersionVector | None = None) -> bytes:
+    def export_state_vector(self) -> bytes:
+        """Encode the current version vector for a peer to pass back as ``since``."""
+        return self._doc.oplog_vv.encode()
+
+    def export_updates(self, since: VersionVector | bytes | None = None) -> bytes:
+        """Export the ops missing from ``since`` (everything when omitted).
+
+        ``since`` may be a VersionVector or the bytes of :meth:`export_state_vector`.
+        """
         if since is None:
             since = VersionVector()
-        with self._lock:
+        elif isinstance(since, bytes):
+            since = decode_version_vector(since)
+        with self._write_lock:
             return self._doc.export(ExportMode.Updates(since))
 
+    def export_updates_with_vv(self, since: VersionVector) -> tuple[bytes, VersionVector]:
+        """Export updates since ``since`` together with the version vector they reach.
+
+        Both are read under the write lock, so the vector matches the exported bytes exactly.
+        """
+        with self._write_lock:
+            return self._doc.export(ExportMode.Updates(since)), self._doc.oplog_vv
+
+    def merge_local_updates(self, updates: list[bytes]) -> bytes | None:
+        """Re-export several update blobs produced by this store as a single blob.
+
+        The export covers exactly the counter ranges the blobs span, so ops
+        imported from other peers or committed after the last blob are not
+        included. Returns None when the blobs cannot be read, in which case
+        callers should send them individually.
+        """
+        try:
+            metas = [LoroDoc.decode_import_blob_meta(update, False) for update in updates]
+        except BaseException as exc:
+            if not is_decode_error(exc):
+                raise
+            return None
+        ranges: dict[int, tuple[int, int]] = {}
+        for meta in metas:
+            starts = meta.partial_start_vv.to_spans().inner()
+            for peer, (_, end) in meta.partial_end_vv.to_spans().inner().items():
+                start = starts[peer][1] if peer in starts else 0
+                if peer in ranges:
+                    lo, hi = ranges[peer]
+                    start, end = min(lo, start), max(hi, end)
+                ranges[peer] = (start, end)
+        spans = [IdSpan(peer, CounterSpan(start, end)) for peer, (start, end) in ranges.items()]
+        with self._write_lock:
+            return self._doc.export(ExportMode.UpdatesInRange(spans))
+
     def import_updates(self, data: bytes) -> None:
-        with self._lock:
-            self._doc.import_batch([data])
+        self.import_batch([data])
 
     def import_batch(self, updates: list[bytes]) -> None:
-        with self._lock:
-            self._doc.import_batch(updates)
+        with self._write_lock:
+            try:
+                self._doc.import_batch(updates)
+            except BaseException as exc:
+                if not is_decode_error(exc):
+                    raise
+                raise ValueError(f"invalid CRDT update data: {exc}") from exc
 
     def on_local_update(self, callback: Callable[[bytes], bool]) -> None:
-        """Subscribe to local updates. Callback receives raw update bytes and must return bool."""
-        with self._lock:
+        """Subscribe to local updates. Callback receives raw update bytes and must return bool.
+
+        Fires once per commit with the encoded ops of the whole transaction.
+        """
+        with self._write_lock:
             self._local_update_sub = self._doc.subscribe_local_update(callback)
 
     def on_change(self, callback: Callable[[Any], None]) -> None:
-        """Subscribe to all changes (local and remote)."""
-        with self._lock:
+        """Subscribe to all changes (local and remote).
+
+        Fires once per commit or import with a single event batching every
+        container diff, not once per op.
+        """
+        with self._write_lock:
             self._root_sub = self._doc.subscribe_root(callback)
 
+    def root_map_names(self) -> list[str]:
+        """Names of the root map containers, read from the shallow root value."""
+        roots = cast(dict[str, Any], self._doc.get_value())
+        return [name for name, cid in roots.items() if isinstance(cid.container_type, ContainerType.Map)]
+
     def get_deep_value(self) -> dict[str, Any]:
-        with self._lock:
-            return cast(dict[str, Any], self._doc.get_deep_value())
+        return cast(dict[str, Any], self._doc.get_deep_value())
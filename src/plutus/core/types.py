@@ -19,7 +19,7 @@ class ContainerKind(Enum):
     COUNTER = auto()
 
 
-@dataclass
+@dataclass(slots=True)
 class Shard:
     """Defines a named slice of the CRDT document that an agent cares about."""
 
@@ -27,6 +27,6 @@ class Shard:
     prefixes: list[str] = field(default_factory=list)
 
     def matches(self, key: str) -> bool:
-        if not self.prefixes:
-            return True
-        return any(key.startswith(p) for p in self.prefixes)
+        # str.startswith checks a tuple of prefixes in C. The tuple is built per
+        # call rather than cached because ``prefixes`` is a mutable list.
+        return not self.prefixes or key.startswith(tuple(self.prefixes))
@@ -2,11 +2,13 @@
 
 from __future__ import annotations
 
+import asyncio
 import logging
 
 import anyio
+from loro import VersionVector
 
-from plutus.core.store import CRDTStore
+from plutus.core.store import CRDTStore, decode_version_vector
 from plutus.net.broadcaster import DiffBroadcaster
 from plutus.net.event_log import EventLog
 from plutus.net.peer import PeerManager
@@ -18,6 +20,9 @@ from plutus.net.transport import (
 
 logger = logging.getLogger(__name__)
 
+# Catch-up deltas can span a peer's whole absence, so compress them like broadcasts.
+_CATCH_UP_COMPRESS_THRESHOLD = 4096
+
 
 class SyncDaemon:
     """Central WebSocket hub that manages shared CRDT state for agent sandboxes.
@@ -33,8 +38,10 @@ class SyncDaemon:
         *,
         auth_token: str | None = None,
         max_message_size: int | None = 10 * 1024 * 1024,
+        max_import_batch: int = 256,
     ) -> None:
-        self._store = CRDTStore()
+        # The hub store may be touched from server callbacks and embedding threads.
+        self._store = CRDTStore(allow_multithreading=True)
         self._server = WebSocketServer(
             host=host,
             port=port,
@@ -48,11 +55,22 @@ class SyncDaemon:
         )
         self._peers = PeerManager()
         self._server.on_message(self._handle_message)
+        # Received updates are coalesced and imported by _import_loop in batches.
+        self._pending: list[tuple[list[bytes], bytes]] = []  # (payloads, encoded envelope)
+        self._pending_event = anyio.Event()
+        self._max_import_batch = max_import_batch
+        self._import_task: asyncio.Task[None] | None = None
+        self._catch_up_tasks: set[asyncio.Task[None]] = set()
 
     @property
     def store(self) -> CRDTStore:
         return self._store
 
+    @property
+    def port(self) -> int:
+        """Listening port; with ``port=0`` this is the ephemeral port chosen by :meth:`start`."""
+        return self._server.port
+
     @property
     def peers(self) -> PeerManager:
         return self._peers
@@ -61,30 +79,114 @@ class SyncDaemon:
     def event_log(self) -> EventLog:
         return self._event_log
 
+    @staticmethod
+    def _decode_vv(payload: bytes | memoryview) -> VersionVector | None:
+        """Decode a version vector carried by JOIN/HEARTBEAT; None if absent or invalid."""
+        if not payload:
+            return None
+        try:
+            return decode_version_vector(bytes(payload))
+        except ValueError:
+            logger.warning("ignoring malformed version vector in envelope")
+            return None
+
     def _handle_message(self, envelope: Envelope) -> None:
         if envelope.msg_type == MessageType.JOIN:
-            self._peers.add_peer(envelope.sender)
+            vv = self._decode_vv(envelope.payload)
+            self._peers.add_peer(envelope.sender, vv=vv)
             logger.info("peer joined: %s", envelope.sender)
+            if vv is not None:
+                task = asyncio.get_running_loop().create_task(self._send_catch_up(envelope.sender, vv))
+                self._catch_up_tasks.add(task)
+                task.add_done_callback(self._catch_up_tasks.discard)
         elif envelope.msg_type == MessageType.LEAVE:
             self._peers.remove_peer(envelope.sender)
             logger.info("peer left: %s", envelope.sender)
         elif envelope.msg_type == MessageType.HEARTBEAT:
-            self._peers.record_heartbeat(envelope.sender)
-        elif envelope.msg_type == MessageType.CRDT_UPDATE:
+            self._peers.record_heartbeat(envelope.sender, self._decode_vv(envelope.payload))
+        elif envelope.msg_type in (MessageType.CRDT_UPDATE, MessageType.BATCH):
             try:
-                self._store.import_updates(envelope.payload)
-                self._event_log.append(envelope.encode())
-            except Exception:
-                logger.exception("failed to import CRDT update from sender=%s", envelope.sender)
+                payloads = envelope.update_payloads()
+            except ValueError:
+                logger.warning("dropping malformed update envelope from sender=%s", envelope.sender)
+                return
+            self._pending.append((payloads, envelope.encode()))
+            self._pending_event.set()
+
+    def _import_pending(self) -> None:
+        """Import everything queued so far, up to ``max_import_batch`` payloads per call."""
+        pending, self._pending = self._pending, []
+        imported: list[bytes] = []
+        group: list[tuple[list[bytes], bytes]] = []
+        size = 0
+        for entry in pending:
+            group.append(entry)
+            size += len(entry[0])
+            if size >= self._max_import_batch:
+                self._import_group(group, imported)
+                group, size = [], 0
+        if group:
+            self._import_group(group, imported)
+        self._event_log.append_many(imported)
+
+    def _import_group(self, group: list[tuple[list[bytes], bytes]], imported: list[bytes]) -> None:
+        try:
+            self._store.import_batch([p for payloads, _ in group for p in payloads])
+        except ValueError:
+            # Re-importing applied ops is a no-op, so retry per envelope to
+            # isolate the bad one and keep it out of the event log.
+            for payloads, frame in group:
+                try:
+                    self._store.import_batch(payloads)
+                except ValueError:
+                    logger.exception("failed to import CRDT update")
+                else:
+                    imported.append(frame)
+        else:
+            imported.extend(frame for _, frame in group)
+
+    async def _send_catch_up(self, peer_id: int, peer_vv: VersionVector) -> None:
+        """Send a joining peer only the ops its version vector is missing."""
+        self._import_pending()
+        updates, current_vv = self._store.export_updates_with_vv(since=peer_vv)
+        if peer_vv.includes_vv(current_vv):
+            return
+        envelope = Envelope(
+            msg_type=MessageType.CRDT_UPDATE,
+            sender=self._store.peer_id,
+            target=peer_id,
+            payload=updates,
+        ).compressed(_CATCH_UP_COMPRESS_THRESHOLD)
+        if not await self._server.send_to(peer_id, envelope):
+            logger.debug("catch-up for peer %s not delivered", peer_id)
+
+    async def _import_loop(self) -> None:
+        while True:
+            await self._pending_event.wait()
+            self._pending_event = anyio.Event()
+            self._import_pending()
 
     async def start(self) -> None:
         self._broadcaster.start_local_subscription()
+        self._import_task = asyncio.create_task(self._import_loop(), name="plutus-daemon-import-loop")
         await self._server.start()
         logger.info("sync daemon started")
 
     async def stop(self) -> None:
         self._broadcaster.stop()
+        for task in list(self._catch_up_tasks):
+            task.cancel()
         await self._server.stop()
+        if self._import_task is not None:
+            self._import_task.cancel()
+            try:
+                await self._import_task
+            except asyncio.CancelledError:
+                pass
+            self._import_task = None
+        # Apply whatever arrived after the loop's last drain.
+        self._import_pending()
+        self._event_log.close()
         logger.info("sync daemon stopped")
 
     async def run_forever(self) -> None:
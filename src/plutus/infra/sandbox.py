@@ -4,8 +4,16 @@ from __future__ import annotations
 
 import abc
 import logging
+import os
+import secrets
+import shlex
+import signal
+import subprocess
 from typing import Any
 
+import anyio
+from anyio.abc import Process
+
 logger = logging.getLogger(__name__)
 
 
@@ -22,35 +30,125 @@ class SandboxAdapter(abc.ABC):
     async def exec(self, command: str) -> str: ...
 
     @abc.abstractmethod
-    async def write_file(self, path: str, content: str) -> None: ...
+    async def write_file(self, path: str, content: str | bytes) -> None:
+        """Write ``content`` to ``path``; bytes are written as-is, without text encoding."""
 
     @abc.abstractmethod
     async def read_file(self, path: str) -> str: ...
 
 
 class LocalSandboxAdapter(SandboxAdapter):
-    """Sandbox adapter that runs commands locally (no isolation)."""
+    """Sandbox adapter that runs commands locally (no isolation).
+
+    With ``persistent_shell=True`` commands are piped to one long-lived shell
+    instead of spawning ``/bin/sh`` per call. Each command still runs in its own
+    subshell, so ``cd``/``export``/``exit`` do not leak between calls, but stderr
+    is discarded rather than attached to :class:`subprocess.CalledProcessError`.
+    """
 
-    def __init__(self, working_dir: str = ".") -> None:
+    def __init__(self, working_dir: str = ".", *, persistent_shell: bool = False) -> None:
         self._working_dir = working_dir
+        self._persistent_shell = persistent_shell
+        self._shell: Process | None = None
+        self._shell_lock = anyio.Lock()
 
     async def start(self) -> None:
         logger.debug("local sandbox start: cwd=%s", self._working_dir)
+        if self._persistent_shell:
+            async with self._shell_lock:
+                await self._ensure_shell()
 
     async def stop(self) -> None:
         logger.debug("local sandbox stop: cwd=%s", self._working_dir)
+        async with self._shell_lock:
+            shell, self._shell = self._shell, None
+            if shell is not None:
+                # Closing stdin makes the shell exit on its own.
+                await shell.aclose()
 
     async def exec(self, command: str) -> str:
-        import anyio
+        if self._persistent_shell:
+            return await self._exec_persistent(command)
         result = await anyio.run_process(
             ["/bin/sh", "-lc", command],
             cwd=self._working_dir,
         )
         return result.stdout.decode()
 
-    async def write_file(self, path: str, content: str) -> None:
+    async def _ensure_shell(self) -> Process:
+        if self._shell is not None and self._shell.returncode is None:
+            return self._shell
+        self._shell = await anyio.open_process(
+            ["/bin/sh", "-l"],
+            cwd=self._working_dir,
+            stderr=subprocess.DEVNULL,
+            # Own process group, so a reset also kills commands the shell started.
+            start_new_session=True,
+        )
+        # Discard anything the login profile printed before the first command.
+        await self._run_in_shell(self._shell, ":")
+        return self._shell
+
+    async def _exec_persistent(self, command: str) -> str:
+        async with self._shell_lock:
+            try:
+                shell = await self._ensure_shell()
+                returncode, output = await self._run_in_shell(shell, command)
+            except BaseException:
+                # Cancelled or failed before the done-marker was read: the
+                # shell's output stream is out of step and the command may
+                # still be running, so start the next call on a fresh shell.
+                await self._reset_shell()
+                raise
+        if returncode:
+            raise subprocess.CalledProcessError(returncode, command, output)
+        return output.decode()
+
+    async def _reset_shell(self) -> None:
+        shell, self._shell = self._shell, None
+        if shell is None:
+            return
+        with anyio.CancelScope(shield=True):
+            try:
+                os.killpg(shell.pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+            await shell.aclose()
+
+    @staticmethod
+    async def _run_in_shell(shell: Process, command: str) -> tuple[int, bytes]:
+        assert shell.stdin is not None and shell.stdout is not None
+        token = f"__plutus_done_{secrets.token_hex(8)}__"
+        marker = token.encode()
+        # eval inside a subshell keeps syntax errors and state changes from
+        # reaching the persistent shell; stdin is detached so the command
+        # cannot swallow the commands queued after it.
+        script = f"(eval {shlex.quote(command)}) </dev/null\nprintf '%s %d\\n' {token} $?\n"
+        await shell.stdin.send(script.encode())
+        buffer = bytearray()
+        end = -1
+        while True:
+            # Only scan the new chunk (plus a marker-sized overlap), so large
+            # outputs are not rescanned on every read.
+            start = len(buffer)
+            try:
+                buffer += await shell.stdout.receive()
+            except anyio.EndOfStream:
+                raise RuntimeError("persistent sandbox shell exited unexpectedly") from None
+            if end == -1:
+                end = buffer.find(marker, max(0, start - len(marker)))
+            if end != -1 and buffer.find(b"\n", max(start, end + len(marker))) != -1:
+                break
+        returncode = int(buffer[end + len(marker) :].split()[0])
+        return returncode, bytes(buffer[:end])
+
+    async def write_file(self, path: str, content: str | bytes) -> None:
         from pathlib import Path
-        (Path(self._working_dir) / path).write_text(content)
+        target = Path(self._working_dir) / path
+        if isinstance(content, bytes):
+            target.write_bytes(content)
+        else:
+            target.write_text(content)
 
     async def read_file(self, path: str) -> str:
         from pathlib import Path
@@ -99,7 +197,9 @@ class E2BSandboxAdapter(SandboxAdapter):
             raise RuntimeError("sandbox command execution failed") from exc
         return result.stdout
 
-    async def write_file(self, path: str, content: str) -> None:
+    async def write_file(self, path: str, content: str | bytes) -> None:
+        # The SDK uploads bytes as the raw request body, so binary files need
+        # no decode/encode round trip.
         if self._sandbox is None:
             raise RuntimeError("sandbox not started")
         try:
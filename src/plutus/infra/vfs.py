@@ -4,13 +4,92 @@ from __future__ import annotations
 
 import json
 import logging
+import os
 from pathlib import Path
+from typing import Any, cast
 
-from plutus.core.store import CRDTStore
+import anyio
+from loro import LoroDoc, VersionVector
+
+from plutus._util.serialization import pack, unpack
+from plutus.core.store import CRDTStore, decode_version_vector, is_decode_error
+
+try:
+    import orjson  # type: ignore[import-not-found,unused-ignore]
+except ImportError:
+    _HAS_ORJSON = False
+else:
+    _HAS_ORJSON = True
 
 logger = logging.getLogger(__name__)
 
 
+if _HAS_ORJSON:
+
+    def _dumps(value: Any) -> bytes:
+        return orjson.dumps(value, default=str, option=orjson.OPT_INDENT_2)
+
+    def _loads(data: bytes) -> Any:
+        # orjson.JSONDecodeError subclasses json.JSONDecodeError.
+        return orjson.loads(data)
+
+else:
+
+    def _dumps(value: Any) -> bytes:
+        # Raw UTF-8 like orjson, so the bytes on disk do not depend on the backend.
+        return json.dumps(value, indent=2, default=str, ensure_ascii=False).encode()
+
+    def _loads(data: bytes) -> Any:
+        return json.loads(data)
+
+
+def _write_atomic(path: Path, data: bytes) -> None:
+    """Replace ``path`` via a temp file and rename, so readers never see a partial file."""
+    tmp = path.with_name(f".{path.name}.tmp")
+    tmp.write_bytes(data)
+    os.replace(tmp, path)
+
+
+_LORO_MAGIC = b"loro"
+
+
+def _read_snapshot_file(path: Path) -> tuple[bytes, str | None, bytes | None]:
+    """Return ``(updates, base, state_vector)`` for a full or incremental snapshot file.
+
+    Full snapshots are raw Loro blobs (``base`` and ``state_vector`` are None);
+    incremental ones are a msgpack map linking back to their base file.
+    """
+    data = path.read_bytes()
+    if data[:4] == _LORO_MAGIC:
+        return data, None, None
+    try:
+        record = unpack(data)
+    except Exception as exc:
+        raise ValueError(f"invalid snapshot file: {path}") from exc
+    if isinstance(record, dict):
+        updates, base, sv = record.get("updates"), record.get("base"), record.get("sv")
+        if (
+            isinstance(updates, bytes)
+            and isinstance(base, str)
+            and isinstance(sv, bytes)
+        ):
+            return updates, base, sv
+    raise ValueError(f"invalid incremental snapshot file: {path}")
+
+
+def _snapshot_end_vv(path: Path) -> VersionVector:
+    """Version vector a snapshot file (including its base chain) brings a store up to."""
+    updates, _, sv = _read_snapshot_file(path)
+    if sv is not None:
+        return decode_version_vector(sv)
+    try:
+        return LoroDoc.decode_import_blob_meta(updates, False).partial_end_vv
+    except BaseException as exc:
+        if not is_decode_error(exc):
+            raise
+        raise ValueError(f"invalid snapshot file: {path}") from exc
+
+
 class VirtualFilesystem:
     """Maps CRDT document state to JSON files in a directory, and vice versa.
 
@@ -23,19 +102,31 @@ class VirtualFilesystem:
         self._base_dir = Path(base_dir)
         self._base_dir.mkdir(parents=True, exist_ok=True)
 
+    def _encode_state(self) -> list[tuple[Path, bytes]]:
+        state = self._store.get_deep_value()
+        return [
+            (self._base_dir / f"{key}.json", _dumps(value))
+            for key, value in state.items()
+        ]
+
     def sync_to_disk(self) -> None:
         """Write current CRDT state to JSON files."""
-        state = self._store.get_deep_value()
-        for key, value in state.items():
-            path = self._base_dir / f"{key}.json"
-            path.write_text(json.dumps(value, indent=2, default=str))
+        for path, data in self._encode_state():
+            _write_atomic(path, data)
+
+    async def sync_to_disk_async(self) -> None:
+        """Like :meth:`sync_to_disk`, but writes the files concurrently off the event loop."""
+        items = self._encode_state()
+        async with anyio.create_task_group() as tg:
+            for path, data in items:
+                tg.start_soon(anyio.to_thread.run_sync, _write_atomic, path, data)
 
     def sync_from_disk(self) -> None:
         """Read JSON files and write them into the CRDT store."""
         for path in self._base_dir.glob("*.json"):
             key = path.stem
             try:
-                data = json.loads(path.read_text())
+                data = _loads(path.read_bytes())
             except json.JSONDecodeError:
                 logger.warning("skipping malformed JSON file: %s", path)
                 continue
@@ -44,7 +135,12 @@ class VirtualFilesystem:
                 continue
             if isinstance(data, dict):
                 m = self._store.get_map(key)
+                # One FFI call for the current values, then only write keys that
+                # changed; re-reading files we just wrote becomes a no-op.
+                current = cast(dict[str, Any], m.get_deep_value())
                 for k, v in data.items():
+                    if k in current and type(current[k]) is type(v) and current[k] == v:
+                        continue
                     try:
                         m.insert(k, v)
                     except Exception:
@@ -53,13 +149,46 @@ class VirtualFilesystem:
                 logger.warning("skipping non-object JSON root in file: %s", path)
         self._store.commit()
 
-    def write_snapshot(self, path: str | Path | None = None) -> Path:
-        """Write a binary CRDT snapshot to disk."""
+    def write_snapshot(
+        self, path: str | Path | None = None, *, base: str | Path | None = None
+    ) -> Path:
+        """Write a binary CRDT snapshot to disk.
+
+        With ``base`` (a snapshot previously written from this store's history),
+        only the ops added since ``base`` are written, linked back to it;
+        :meth:`load_snapshot` follows the chain. Write a full snapshot now and
+        then to keep recovery chains short.
+        """
         snapshot_path = Path(path) if path else self._base_dir / "snapshot.bin"
-        snapshot_path.write_bytes(self._store.export_snapshot())
+        if base is None:
+            _write_atomic(snapshot_path, self._store.export_snapshot())
+            return snapshot_path
+
+        base_path = Path(base)
+        if base_path.resolve() == snapshot_path.resolve():
+            raise ValueError("an incremental snapshot cannot overwrite its own base")
+        delta, vv = self._store.export_updates_with_vv(_snapshot_end_vv(base_path))
+        record = {
+            "base": os.path.relpath(base_path, snapshot_path.parent),
+            "sv": vv.encode(),
+            "updates": delta,
+        }
+        _write_atomic(snapshot_path, pack(record))
         return snapshot_path
 
     def load_snapshot(self, path: str | Path | None = None) -> None:
-        """Load a binary CRDT snapshot from disk."""
+        """Load a full or incremental snapshot (and its base chain) from disk."""
         snapshot_path = Path(path) if path else self._base_dir / "snapshot.bin"
-        self._store.import_updates(snapshot_path.read_bytes())
+        chain: list[bytes] = []
+        seen: set[Path] = set()
+        current: Path | None = snapshot_path
+        while current is not None:
+            resolved = current.resolve()
+            if resolved in seen:
+                raise ValueError(f"snapshot chain loops back to {current}")
+            seen.add(resolved)
+            updates, base, _ = _read_snapshot_file(current)
+            chain.append(updates)
+            current = current.parent / base if base is not None else None
+        chain.reverse()
+        self._store.import_batch(chain)
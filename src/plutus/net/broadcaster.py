@@ -3,7 +3,7 @@
 from __future__ import annotations
 
 import logging
-from threading import Lock
+from collections import deque
 from typing import Callable
 
 import anyio
@@ -14,6 +14,9 @@ from plutus.net.transport import Envelope, MessageType, Transport
 
 logger = logging.getLogger(__name__)
 
+# Sent frames are logged in groups; flush early once this many are buffered.
+_LOG_FLUSH_FRAMES = 256
+
 
 class DiffBroadcaster:
     """Subscribes to local CRDT updates, broadcasts them via transport,
@@ -24,6 +27,11 @@ class DiffBroadcaster:
         store: CRDTStore,
         transport: Transport | None = None,
         event_log: EventLog | None = None,
+        *,
+        max_batch: int = 32,
+        batch_window: float = 0.0,
+        compress_threshold: int | None = 4096,
+        max_pending: int = 1024,
     ) -> None:
         self._store = store
         self._transport = transport
@@ -31,13 +39,28 @@ class DiffBroadcaster:
         self._running = False
         self._local_update_cb: Callable[[bytes], bool] | None = None
         self._suppress_local_updates = 0
-        self._pending_send, self._pending_recv = anyio.create_memory_object_stream[bytes](1024)
-        self._pending_lock = Lock()
-        self._pending_count = 0
+        # Single producer (local commits) / single consumer (send_loop) queue.
+        # _wake is only re-armed by send_loop and _pending_drained only when the
+        # queue goes from empty to non-empty, not per update.
+        self._pending: deque[bytes] = deque()
+        self._max_pending = max_pending
+        self._closed = False
+        # Set when the local-update hook could not queue an update; the owner
+        # re-exports from its watermark instead of trusting the queue.
+        self._dropped_local_update = False
+        self._wake = anyio.Event()
         self._pending_drained = anyio.Event()
         self._pending_drained.set()
+        self._max_batch = max_batch
+        self._batch_window = batch_window
+        # Payloads at or above this size are zlib-compressed; None disables it.
+        self._compress_threshold = compress_threshold
+        # Frames sent by send_loop, written to the event log in one append_many
+        # whenever the queue drains rather than one file write per frame.
+        self._log_buffer: list[bytes] = []
 
     def bind_transport(self, transport: Transport) -> None:
+        """Swap the transport used by the running send/receive loops."""
         self._transport = transport
 
     def suppress_next_local_update(self) -> None:
@@ -60,16 +83,38 @@ class DiffBroadcaster:
                 self._event_log.append(envelope.encode())
             return True
 
-        try:
-            self._pending_send.send_nowait(update_bytes)
-            with self._pending_lock:
-                if self._pending_count == 0:
-                    self._pending_drained = anyio.Event()
-                self._pending_count += 1
-        except anyio.WouldBlock:
-            logger.warning("dropping local CRDT update because broadcaster queue is full")
-        except (anyio.ClosedResourceError, anyio.BrokenResourceError):
+        if not self.enqueue_update(update_bytes):
+            self._dropped_local_update = True
+        return True
+
+    def take_dropped_local_update(self) -> bool:
+        """Return whether a local update was dropped since the last call, and reset the flag."""
+        dropped = self._dropped_local_update
+        self._dropped_local_update = False
+        return dropped
+
+    @property
+    def closed(self) -> bool:
+        """True once :meth:`stop` has run; every later enqueue is rejected."""
+        return self._closed
+
+    def enqueue_update(self, update_bytes: bytes) -> bool:
+        """Queue an update for send_loop, which coalesces queued updates into one frame.
+
+        Returns False when the queue is full (backpressure: retry later) or the
+        broadcaster is stopped; check :attr:`closed` to tell the two apart.
+        """
+        if self._closed:
             logger.debug("ignoring local update because broadcaster queue is closed")
+            return False
+        pending = self._pending
+        if len(pending) >= self._max_pending:
+            logger.warning("dropping local CRDT update because broadcaster queue is full")
+            return False
+        if self._pending_drained.is_set():
+            self._pending_drained = anyio.Event()
+        pending.append(update_bytes)
+        self._wake.set()
         return True
 
     def start_local_subscription(self) -> None:
@@ -77,19 +122,62 @@ class DiffBroadcaster:
         self._local_update_cb = self._on_local_update
         self._store.on_local_update(self._on_local_update)
 
+    def _encode_for_send(self, envelope: Envelope) -> bytes:
+        """Compress if large and encode once; the same frame is sent and logged."""
+        if self._compress_threshold is not None:
+            envelope = envelope.compressed(self._compress_threshold)
+        return envelope.encode()
+
+    def _log_sent(self, frame: bytes) -> None:
+        if self._event_log is not None:
+            self._log_buffer.append(frame)
+            if len(self._log_buffer) >= _LOG_FLUSH_FRAMES:
+                self.flush_log()
+
+    def flush_log(self) -> None:
+        """Write buffered sent frames to the event log."""
+        buffered, self._log_buffer = self._log_buffer, []
+        if buffered and self._event_log is not None:
+            self._event_log.append_many(buffered)
+
+    def _encode_update(self, update_bytes: bytes) -> bytes:
+        return self._encode_for_send(
+            Envelope(
+                msg_type=MessageType.CRDT_UPDATE,
+                sender=self._store.peer_id,
+                target=None,
+                payload=update_bytes,
+            )
+        )
+
     async def broadcast_update(self, update_bytes: bytes) -> None:
         """Broadcast an update to the transport and append it to the event log."""
+        try:
+            await self._send_payloads([update_bytes])
+        finally:
+            self.flush_log()
+
+    async def broadcast_batch(self, payloads: list[bytes]) -> None:
+        """Broadcast several updates in one BATCH envelope (one transport send)."""
+        try:
+            await self._send_payloads(payloads)
+        finally:
+            self.flush_log()
+
+    async def _send_payloads(self, payloads: list[bytes]) -> None:
         if not self._transport:
             return
-        envelope = Envelope(
-            msg_type=MessageType.CRDT_UPDATE,
-            sender=self._store.peer_id,
-            target=None,
-            payload=update_bytes,
-        )
-        if self._event_log is not None:
-            self._event_log.append(envelope.encode())
-        await self._transport.send(envelope)
+        if len(payloads) == 1:
+            frame = self._encode_update(payloads[0])
+        else:
+            frame = self._encode_for_send(Envelope.batch(self._store.peer_id, payloads))
+        await self._transport.send_frame(frame)
+        self._log_sent(frame)
+
+    def _take_batch(self) -> list[bytes]:
+        pending = self._pending
+        count = min(len(pending), self._max_batch)
+        return [pending.popleft() for _ in range(count)]
 
     async def send_loop(self, task_status: anyio.abc.TaskStatus = anyio.TASK_STATUS_IGNORED) -> None:
         """Continuously send locally queued updates over the transport."""
@@ -97,24 +185,36 @@ class DiffBroadcaster:
         task_status.started()
         try:
             while self._running:
+                if not self._pending:
+                    await self._wake.wait()
+                    self._wake = anyio.Event()
+                    continue
+                if self._batch_window > 0:
+                    await anyio.sleep(self._batch_window)
+                    if not self._running:
+                        break
+                batch = self._take_batch()
+                if len(batch) > 1:
+                    # Queued blobs all come from the local store, so one export of
+                    # exactly their op ranges replaces them with a smaller delta.
+                    merged = self._store.merge_local_updates(batch)
+                    if merged is not None:
+                        batch = [merged]
                 try:
-                    update_bytes = await self._pending_recv.receive()
-                except anyio.EndOfStream:
-                    break
-                if not self._running:
-                    break
-                try:
-                    await self.broadcast_update(update_bytes)
+                    await self._send_payloads(batch)
                 except Exception:
                     logger.exception("failed to send CRDT update")
+                    # Callers advance their sync watermark once an update is
+                    # queued, so put the batch back for the restarted loop to
+                    # resend instead of dropping those ops.
+                    self._pending.extendleft(reversed(batch))
                     break
                 finally:
-                    with self._pending_lock:
-                        if self._pending_count > 0:
-                            self._pending_count -= 1
-                        if self._pending_count == 0:
-                            self._pending_drained.set()
+                    if not self._pending:
+                        self.flush_log()
+                        self._pending_drained.set()
         finally:
+            self.flush_log()
             self._running = False
 
     async def receive_loop(self, task_status: anyio.abc.TaskStatus = anyio.TASK_STATUS_IGNORED) -> None:
@@ -127,11 +227,17 @@ class DiffBroadcaster:
         task_status.started()
         try:
             while self._running:
+                transport = self._transport
+                if transport is None:
+                    break
                 try:
-                    envelope = await self._transport.receive()
+                    envelope = await transport.receive()
                 except Exception:
+                    if self._transport is not transport:
+                        # Rebound via bind_transport(); resume on the new transport.
+                        continue
                     logger.exception("receive loop hit transport error")
-                    reconnect = getattr(self._transport, "reconnect", None)
+                    reconnect = getattr(transport, "reconnect", None)
                     if reconnect is None:
                         break
                     try:
@@ -140,20 +246,30 @@ class DiffBroadcaster:
                         logger.exception("receive loop reconnect failed")
                         break
                     continue
-                if envelope.msg_type == MessageType.CRDT_UPDATE:
-                    self._store.import_updates(envelope.payload)
+                if envelope.msg_type in (MessageType.CRDT_UPDATE, MessageType.BATCH):
+                    try:
+                        payloads = envelope.update_payloads()
+                    except ValueError:
+                        logger.warning("dropping malformed batch envelope from sender=%s", envelope.sender)
+                        continue
+                    self._store.import_batch(payloads)
         finally:
             self._running = False
 
     def stop(self) -> None:
         self._running = False
-        with self._pending_lock:
-            self._pending_count = 0
-            self._pending_drained.set()
-        self._pending_send.close()
+        self._closed = True
+        self._pending.clear()
+        self.flush_log()
+        self._pending_drained.set()
+        self._wake.set()
 
-    async def flush_pending(self, timeout: float | None = None) -> bool:
-        """Wait until queued local updates are drained by send_loop."""
+    async def flush(self, timeout: float | None = None) -> bool:
+        """Wait until send_loop has sent every queued local update.
+
+        Enqueueing stays non-blocking; call this once at a barrier (e.g. before
+        leaving) instead of awaiting each send. Returns False on timeout.
+        """
         if timeout is None:
             await self._pending_drained.wait()
             return True
@@ -161,15 +277,32 @@ class DiffBroadcaster:
             await self._pending_drained.wait()
         return not scope.cancel_called
 
+    async def flush_pending(self, timeout: float | None = None) -> bool:
+        """Alias of :meth:`flush`."""
+        return await self.flush(timeout)
+
     def replay_log(self) -> None:
         """Import all entries from the event log into the store."""
         if not self._event_log:
             return
+        own_peer = self._store.peer_id
+        groups: list[list[bytes]] = []
         for entry in self._event_log.replay():
             try:
                 envelope = Envelope.decode(entry)
+                if envelope.sender != own_peer:
+                    groups.append(envelope.update_payloads())
             except ValueError:
                 logger.warning("skipping malformed event log entry during replay")
-                continue
-            if envelope.sender != self._store.peer_id:
-                self._store.import_updates(envelope.payload)
+        if not groups:
+            return
+        try:
+            # One import for the whole log instead of one merge per entry.
+            self._store.import_batch([p for payloads in groups for p in payloads])
+        except ValueError:
+            # Re-importing applied ops is a no-op, so retry per entry to skip the bad one.
+            for payloads in groups:
+                try:
+                    self._store.import_batch(payloads)
+                except ValueError:
+                    logger.warning("skipping malformed batch entry during replay")
@@ -3,18 +3,51 @@
 from __future__ import annotations
 
 import logging
+import mmap
+import os
 import struct
+from collections import deque
 from pathlib import Path
-from threading import RLock
-from typing import Iterator
+from threading import Lock
+from typing import BinaryIO, Iterator
 
 logger = logging.getLogger(__name__)
 
+# Length prefix of every record; compiled once instead of per pack/unpack call.
+_LEN = struct.Struct("!I")
+_LEN_SIZE = _LEN.size
+# writev hands the kernel the length prefixes and payloads in place, without
+# joining them into one buffer first; it is POSIX-only.
+_HAS_WRITEV = hasattr(os, "writev")
+_IOV_MAX = 1024
+# sysconf reports -1 when the limit is indeterminate; keep the default then.
+if "SC_IOV_MAX" in getattr(os, "sysconf_names", {}) and os.sysconf("SC_IOV_MAX") > 0:
+    _IOV_MAX = os.sysconf("SC_IOV_MAX")
+
+
+def _writev_all(fd: int, parts: list[bytes]) -> None:
+    for start in range(0, len(parts), _IOV_MAX):
+        batch = parts[start : start + _IOV_MAX]
+        written = os.writev(fd, batch)
+        total = sum(len(part) for part in batch)
+        if written < total:
+            # Short writes are rare on regular files; finish the batch the slow way.
+            rest = memoryview(b"".join(batch))[written:]
+            while rest:
+                rest = rest[os.write(fd, rest) :]
+
 
 class EventLog:
     """Append-only log storing length-prefixed binary entries.
 
     Wire format: [4-byte big-endian length][payload bytes]
+
+    Entries evicted by retention stay in the file as a dead prefix until it
+    outgrows the live records, so the file is rewritten at most once per
+    doubling rather than on every eviction; reopen the log with the same limits
+    to skip them. The file is kept open between appends. With ``flush_bytes`` set, appended
+    records are held in memory and written in one call once that many bytes
+    are pending, or on :meth:`flush`/:meth:`close`; the default writes through.
     """
 
     def __init__(
@@ -23,49 +56,120 @@ class EventLog:
         *,
         max_entries: int | None = None,
         max_bytes: int | None = None,
+        flush_bytes: int = 0,
     ) -> None:
         self._path = Path(path) if path else None
-        self._lock = RLock()
-        self._entries: list[bytes] = []
+        self._lock = Lock()
+        self._entries: deque[bytes] = deque()
         self._total_bytes = 0
         self._max_entries = max_entries
         self._max_bytes = max_bytes
+        self._fh: BinaryIO | None = None
+        self._flush_bytes = flush_bytes
+        self._unwritten: list[bytes] = []
+        self._unwritten_bytes = 0
+        # Bytes at the head of the file that belong to already-evicted entries.
+        self._dead_bytes = 0
         if self._path and self._path.exists():
             self._load()
+            self._dead_bytes = self._enforce_limits()
 
     def _load(self) -> None:
         assert self._path is not None
-        data = self._path.read_bytes()
-        offset = 0
-        while offset < len(data):
-            if offset + 4 > len(data):
-                break
-            length = struct.unpack("!I", data[offset : offset + 4])[0]
-            offset += 4
-            if offset + length > len(data):
-                break
-            entry = data[offset : offset + length]
-            self._entries.append(entry)
-            self._total_bytes += len(entry)
-            offset += length
+        with self._path.open("rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return
+            # Map the file so only the decoded entries are copied into the heap.
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                # Bound locals keep attribute lookups out of the per-record loop.
+                unpack_from = _LEN.unpack_from
+                append = self._entries.append
+                size = len(data)
+                offset = 0
+                loaded = 0
+                while offset + _LEN_SIZE <= size:
+                    (length,) = unpack_from(data, offset)
+                    start = offset + _LEN_SIZE
+                    offset = start + length
+                    if offset > size:
+                        break
+                    append(data[start:offset])
+                    loaded += length
+                self._total_bytes += loaded
 
     def append(self, entry: bytes) -> None:
         with self._lock:
             self._entries.append(entry)
             self._total_bytes += len(entry)
-            self._enforce_limits()
+            evicted = self._enforce_limits()
+            if self._path:
+                self._write_records([_LEN.pack(len(entry)), entry])
+                self._account_evicted(evicted)
+
+    def append_many(self, entries: list[bytes]) -> None:
+        """Append several entries with one lock acquisition and one file write."""
+        if not entries:
+            return
+        with self._lock:
+            self._entries.extend(entries)
+            self._total_bytes += sum(len(entry) for entry in entries)
+            evicted = self._enforce_limits()
             if self._path:
-                # When retention dropped old entries, rewrite the whole log.
-                if self._should_rewrite:
-                    self._rewrite_file()
-                else:
-                    with self._path.open("ab") as f:
-                        f.write(struct.pack("!I", len(entry)))
-                        f.write(entry)
+                self._write_records(
+                    [part for entry in entries for part in (_LEN.pack(len(entry)), entry)]
+                )
+                self._account_evicted(evicted)
+
+    def _account_evicted(self, evicted: int) -> None:
+        if not evicted:
+            return
+        self._dead_bytes += evicted
+        if self._dead_bytes > self._total_bytes + _LEN_SIZE * len(self._entries):
+            self._rewrite_file()
+
+    def _write_records(self, parts: list[bytes]) -> None:
+        self._unwritten.extend(parts)
+        self._unwritten_bytes += sum(len(part) for part in parts)
+        if self._unwritten_bytes >= self._flush_bytes:
+            self._write_unwritten()
+
+    def _write_unwritten(self) -> None:
+        if not self._unwritten:
+            return
+        if self._fh is None:
+            assert self._path is not None
+            self._fh = self._path.open("ab", buffering=0)
+        if _HAS_WRITEV:
+            _writev_all(self._fh.fileno(), self._unwritten)
+        else:
+            self._fh.write(b"".join(self._unwritten))
+        self._unwritten.clear()
+        self._unwritten_bytes = 0
+
+    def _sync(self) -> None:
+        self._write_unwritten()
+        if self._fh is not None:
+            os.fsync(self._fh.fileno())
+
+    def flush(self) -> None:
+        """Write any held-back records and fsync the log file."""
+        with self._lock:
+            self._sync()
+
+    def close(self) -> None:
+        """Flush pending records and release the file handle."""
+        with self._lock:
+            self._sync()
+            if self._fh is not None:
+                self._fh.close()
+                self._fh = None
 
     def replay(self) -> Iterator[bytes]:
+        # Snapshot under the lock, yield outside it: the lock is not reentrant
+        # and callers may append while iterating.
         with self._lock:
-            yield from list(self._entries)
+            entries = list(self._entries)
+        yield from entries
 
     def __len__(self) -> int:
         with self._lock:
@@ -84,23 +188,33 @@ class EventLog:
             self._total_bytes = 0
             self._rewrite_file()
 
-    @property
-    def _should_rewrite(self) -> bool:
-        return bool(self._max_entries is not None or self._max_bytes is not None)
-
-    def _enforce_limits(self) -> None:
-        while self._max_entries is not None and len(self._entries) > self._max_entries:
-            removed = self._entries.pop(0)
-            self._total_bytes -= len(removed)
-
-        while self._max_bytes is not None and self._total_bytes > self._max_bytes and self._entries:
-            removed = self._entries.pop(0)
-            self._total_bytes -= len(removed)
+    def _enforce_limits(self) -> int:
+        """Drop the oldest entries beyond the retention limits; return their on-disk size."""
+        entries = self._entries
+        evicted = 0
+        while self._max_entries is not None and len(entries) > self._max_entries:
+            length = len(entries.popleft())
+            self._total_bytes -= length
+            evicted += _LEN_SIZE + length
+
+        while self._max_bytes is not None and self._total_bytes > self._max_bytes and entries:
+            length = len(entries.popleft())
+            self._total_bytes -= length
+            evicted += _LEN_SIZE + length
+        return evicted
 
     def _rewrite_file(self) -> None:
         if self._path is None:
             return
+        # The rewrite covers every held-back record, and the append handle
+        # would otherwise keep pointing past the truncated end.
+        self._unwritten.clear()
+        self._unwritten_bytes = 0
+        self._dead_bytes = 0
+        if self._fh is not None:
+            self._fh.close()
+            self._fh = None
         with self._path.open("wb") as f:
             for entry in self._entries:
-                f.write(struct.pack("!I", len(entry)))
+                f.write(_LEN.pack(len(entry)))
                 f.write(entry)
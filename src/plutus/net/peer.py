@@ -5,9 +5,11 @@ from __future__ import annotations
 import logging
 import time
 from dataclasses import dataclass, field
-from threading import RLock
+from threading import Lock
 from typing import Any
 
+from loro import VersionVector
+
 logger = logging.getLogger(__name__)
 
 
@@ -17,66 +19,79 @@ class PeerInfo:
     connected_at: float = field(default_factory=time.time)
     last_heartbeat: float = field(default_factory=time.time)
     metadata: dict[str, Any] = field(default_factory=dict)
+    # Latest version vector the peer reported; lets the hub ship only the missing delta.
+    last_ack_vv: VersionVector | None = None
 
 
 class PeerManager:
-    """Tracks connected peers and detects partitions via heartbeat timeouts."""
+    """Tracks connected peers and detects partitions via heartbeat timeouts.
+
+    The peer table is copy-on-write: joins, leaves and pruning publish a new
+    dict under the lock, so readers iterate a snapshot without locking.
+    Heartbeats update the shared PeerInfo in place.
+    """
 
     def __init__(self, heartbeat_timeout: float = 30.0) -> None:
         self._peers: dict[int, PeerInfo] = {}
         self._heartbeat_timeout = heartbeat_timeout
-        self._lock = RLock()
-
-    def add_peer(self, peer_id: int, metadata: dict[str, Any] | None = None) -> PeerInfo:
+        self._lock = Lock()
+
+    def add_peer(
+        self,
+        peer_id: int,
+        metadata: dict[str, Any] | None = None,
+        *,
+        vv: VersionVector | None = None,
+    ) -> PeerInfo:
+        info = PeerInfo(peer_id=peer_id, metadata=metadata or {}, last_ack_vv=vv)
         with self._lock:
-            info = PeerInfo(peer_id=peer_id, metadata=metadata or {})
-            self._peers[peer_id] = info
-            return info
+            peers = dict(self._peers)
+            peers[peer_id] = info
+            self._peers = peers
+        return info
 
     def remove_peer(self, peer_id: int) -> None:
-        with self._lock:
-            self._peers.pop(peer_id, None)
-
-    def record_heartbeat(self, peer_id: int) -> None:
         with self._lock:
             if peer_id in self._peers:
-                self._peers[peer_id].last_heartbeat = time.time()
-            else:
-                logger.debug("heartbeat from unknown peer %s", peer_id)
+                peers = dict(self._peers)
+                del peers[peer_id]
+                self._peers = peers
+
+    def record_heartbeat(self, peer_id: int, vv: VersionVector | None = None) -> None:
+        info = self._peers.get(peer_id)
+        if info is None:
+            logger.debug("heartbeat from unknown peer %s", peer_id)
+            return
+        info.last_heartbeat = time.time()
+        if vv is not None:
+            info.last_ack_vv = vv
 
     def get_peer(self, peer_id: int) -> PeerInfo | None:
-        with self._lock:
-            return self._peers.get(peer_id)
+        return self._peers.get(peer_id)
 
     @property
     def peer_ids(self) -> list[int]:
-        with self._lock:
-            return list(self._peers.keys())
+        return list(self._peers)
 
     @property
     def peer_count(self) -> int:
-        with self._lock:
-            return len(self._peers)
+        return len(self._peers)
+
+    def _stale(self, peers: dict[int, PeerInfo]) -> list[int]:
+        cutoff = time.time() - self._heartbeat_timeout
+        return [pid for pid, info in peers.items() if info.last_heartbeat < cutoff]
 
     def stale_peers(self) -> list[int]:
         """Return peer IDs that haven't sent a heartbeat within the timeout."""
-        now = time.time()
-        with self._lock:
-            return [
-                pid
-                for pid, info in self._peers.items()
-                if now - info.last_heartbeat > self._heartbeat_timeout
-            ]
+        return self._stale(self._peers)
 
     def prune_stale(self) -> list[int]:
         """Remove and return stale peers."""
         with self._lock:
-            now = time.time()
-            stale = [
-                pid
-                for pid, info in self._peers.items()
-                if now - info.last_heartbeat > self._heartbeat_timeout
-            ]
-            for pid in stale:
-                self._peers.pop(pid, None)
+            stale = self._stale(self._peers)
+            if stale:
+                peers = dict(self._peers)
+                for pid in stale:
+                    del peers[pid]
+                self._peers = peers
             return stale
@@ -3,9 +3,13 @@
 from __future__ import annotations
 
 import abc
+import dataclasses
 import logging
-from dataclasses import dataclass
-from enum import IntEnum
+import struct
+import zlib
+from collections import deque
+from dataclasses import dataclass, field
+from enum import IntEnum, IntFlag
 from typing import Any, Callable
 
 import anyio
@@ -27,29 +31,121 @@ class MessageType(IntEnum):
     LEAVE = 4
     SNAPSHOT_REQUEST = 5
     SNAPSHOT_RESPONSE = 6
+    BATCH = 7
+    BUNDLE = 8  # server-to-client: several encoded envelopes in one frame
 
 
-@dataclass
+# Plain dict lookup is much cheaper than the IntEnum call on the decode path.
+_MESSAGE_TYPES: dict[int, MessageType] = {m.value: m for m in MessageType}
+
+
+class EnvelopeFlags(IntFlag):
+    COMPRESSED = 1  # payload is zlib-compressed
+
+
+_COMPRESS_LEVEL = 3
+# Upper bound on an inflated payload, so a small frame cannot expand unboundedly.
+_MAX_DECOMPRESSED_SIZE = 256 * 1024 * 1024
+
+# Frame header: marker, version, msg_type, flags, has_target, sender, target,
+# payload length; the raw payload follows. msgpack never emits 0xC1, so the
+# marker also tells these frames apart from the older msgpack-map encoding,
+# which decode() still accepts (e.g. for existing event logs).
+_FRAME_MARKER = 0xC1
+_HEADER = struct.Struct("!BBBB?QQI")
+# Length prefix of each envelope frame inside a BUNDLE payload.
+_BUNDLE_LEN = struct.Struct("!I")
+# A bundle closes once it reaches this size so it stays well under max_size.
+_MAX_BUNDLE_BYTES = 1024 * 1024
+
+
+@dataclass(slots=True)
 class Envelope:
     """Wire format wrapping CRDT bytes with routing metadata."""
 
     msg_type: MessageType
     sender: int
     target: int | None  # None = broadcast
-    payload: bytes
+    payload: bytes | memoryview  # memoryview is packed as-is, without a bytes copy
     version: int = 1
+    flags: int = 0
+    # Wire bytes this envelope was decoded from or last encoded to. Envelopes
+    # are not mutated after construction, so relaying or logging one reuses
+    # the frame instead of packing it again.
+    _frame: bytes | None = field(default=None, init=False, repr=False, compare=False)
 
     def encode(self) -> bytes:
-        return pack({
-            "v": self.version,
-            "t": int(self.msg_type),
-            "s": self.sender,
-            "r": self.target,
-            "p": self.payload,
-        })
+        if self._frame is not None:
+            return self._frame
+        target = self.target
+        try:
+            header = _HEADER.pack(
+                _FRAME_MARKER,
+                self.version,
+                self.msg_type,
+                self.flags,
+                target is not None,
+                self.sender,
+                0 if target is None else target,
+                len(self.payload),
+            )
+        except struct.error as exc:
+            raise ValueError(f"envelope field out of range: {exc}") from None
+        self._frame = frame = b"".join((header, self.payload))
+        return frame
+
+    @staticmethod
+    def _unpack_header(data: bytes | memoryview) -> tuple[int, MessageType, int, int, int | None]:
+        """Validate a binary frame header; return (version, msg_type, flags, sender, target)."""
+        try:
+            _, version, raw_type, flags, has_target, sender, target, length = _HEADER.unpack_from(data)
+        except struct.error as exc:
+            raise ValueError("truncated envelope header") from exc
+        if len(data) - _HEADER.size != length:
+            raise ValueError("envelope payload length mismatch")
+        if version < 1:
+            raise ValueError("envelope version must be a positive int")
+        msg_type = _MESSAGE_TYPES.get(raw_type)
+        if msg_type is None:
+            raise ValueError("invalid message type in envelope")
+        return version, msg_type, flags, sender, target if has_target else None
+
+    @classmethod
+    def peek_header(cls, data: bytes | memoryview) -> tuple[MessageType, int, int | None]:
+        """Return ``(msg_type, sender, target)`` without materializing the payload."""
+        if not data or data[0] != _FRAME_MARKER:
+            envelope = cls._decode_msgpack(data)
+            return envelope.msg_type, envelope.sender, envelope.target
+        _, msg_type, _, sender, target = cls._unpack_header(data)
+        return msg_type, sender, target
+
+    @classmethod
+    def decode(cls, data: bytes | memoryview) -> Envelope:
+        if not data or data[0] != _FRAME_MARKER:
+            return cls._decode_msgpack(data)
+        version, msg_type, flags, sender, target = cls._unpack_header(data)
+        payload = data[_HEADER.size :]
+        envelope = cls(
+            version=version,
+            msg_type=msg_type,
+            sender=sender,
+            target=target,
+            payload=payload if isinstance(payload, bytes) else bytes(payload),
+            flags=flags,
+        )
+        if isinstance(data, bytes):
+            envelope._frame = data
+        return envelope
 
     @classmethod
-    def decode(cls, data: bytes) -> Envelope:
+    def _decode_msgpack(cls, data: bytes | memoryview) -> Envelope:
+        if isinstance(data, str):
+            # websockets hands text frames over as str; envelopes are binary only.
+            raise ValueError("text frame is not an envelope")
+        # Legacy envelopes are always a small fixmap; refuse anything else
+        # before msgpack gets to allocate whatever structure the bytes describe.
+        if not data or not 0x80 <= data[0] <= 0x8F:
+            raise ValueError("invalid envelope encoding")
         try:
             d = unpack(data)
         except Exception as exc:
@@ -62,25 +158,110 @@ class Envelope:
             raise ValueError("envelope sender must be an int")
         if d["r"] is not None and not isinstance(d["r"], int):
             raise ValueError("envelope target must be None or int")
-        if not isinstance(d["p"], (bytes, bytearray)):
-            raise ValueError("envelope payload must be bytes")
+        payload = d["p"]
+        if not isinstance(payload, bytes):
+            if not isinstance(payload, bytearray):
+                raise ValueError("envelope payload must be bytes")
+            payload = bytes(payload)
         version = d.get("v", 1)
         if not isinstance(version, int) or version < 1:
             raise ValueError("envelope version must be a positive int")
+        flags = d.get("f", 0)
+        if not isinstance(flags, int) or flags < 0:
+            raise ValueError("envelope flags must be a non-negative int")
 
-        try:
-            msg_type = MessageType(d["t"])
-        except Exception as exc:
-            raise ValueError("invalid message type in envelope") from exc
+        raw_type = d["t"]
+        msg_type = _MESSAGE_TYPES.get(raw_type) if type(raw_type) is int else None
+        if msg_type is None:
+            raise ValueError("invalid message type in envelope")
 
         return cls(
             version=version,
             msg_type=msg_type,
             sender=d["s"],
             target=d["r"],
-            payload=bytes(d["p"]),
+            payload=payload,
+            flags=flags,
+        )
+
+    @classmethod
+    def batch(cls, sender: int, payloads: list[bytes]) -> Envelope:
+        """Pack several CRDT update blobs into a single BATCH envelope."""
+        return cls(
+            msg_type=MessageType.BATCH,
+            sender=sender,
+            target=None,
+            payload=pack(payloads),
         )
 
+    @classmethod
+    def bundle(cls, frames: list[bytes]) -> Envelope:
+        """Pack several already-encoded envelopes into one BUNDLE envelope."""
+        return cls(
+            msg_type=MessageType.BUNDLE,
+            sender=0,
+            target=None,
+            payload=b"".join(part for frame in frames for part in (_BUNDLE_LEN.pack(len(frame)), frame)),
+        )
+
+    def unbundle(self) -> list[Envelope]:
+        """Decode the envelopes carried by a BUNDLE envelope.
+
+        Inner frames are decoded from views over the bundle, so each payload is
+        copied once (into the ``bytes`` Loro requires) rather than twice.
+        """
+        data = memoryview(self.payload)
+        envelopes: list[Envelope] = []
+        offset = 0
+        while offset < len(data):
+            if offset + _BUNDLE_LEN.size > len(data):
+                raise ValueError("truncated bundle entry")
+            (length,) = _BUNDLE_LEN.unpack_from(data, offset)
+            offset += _BUNDLE_LEN.size
+            if offset + length > len(data):
+                raise ValueError("truncated bundle entry")
+            envelopes.append(Envelope.decode(data[offset : offset + length]))
+            offset += length
+        return envelopes
+
+    def compressed(self, threshold: int) -> Envelope:
+        """Return a copy with a zlib-compressed payload if it is at least ``threshold`` bytes.
+
+        Returns ``self`` unchanged for small payloads or when compression does not help.
+        """
+        if self.flags & EnvelopeFlags.COMPRESSED or len(self.payload) < threshold:
+            return self
+        packed = zlib.compress(self.payload, _COMPRESS_LEVEL)
+        if len(packed) >= len(self.payload):
+            return self
+        return dataclasses.replace(self, payload=packed, flags=self.flags | EnvelopeFlags.COMPRESSED)
+
+    def raw_payload(self) -> bytes:
+        """Return the payload bytes, inflating them if the envelope is compressed."""
+        payload = self.payload
+        if not self.flags & EnvelopeFlags.COMPRESSED:
+            return payload if isinstance(payload, bytes) else bytes(payload)
+        inflater = zlib.decompressobj()
+        try:
+            data = inflater.decompress(payload, _MAX_DECOMPRESSED_SIZE)
+        except zlib.error as exc:
+            raise ValueError("invalid compressed envelope payload") from exc
+        if inflater.unconsumed_tail:
+            raise ValueError("compressed envelope payload exceeds size limit")
+        return data
+
+    def update_payloads(self) -> list[bytes]:
+        """Return the CRDT update blobs carried by a CRDT_UPDATE or BATCH envelope."""
+        if self.msg_type != MessageType.BATCH:
+            return [self.raw_payload()]
+        try:
+            items = unpack(self.raw_payload())
+        except Exception as exc:
+            raise ValueError("invalid batch envelope encoding") from exc
+        if not isinstance(items, list) or not all(isinstance(i, (bytes, bytearray)) for i in items):
+            raise ValueError("batch envelope payload must be a list of bytes")
+        return [i if isinstance(i, bytes) else bytes(i) for i in items]
+
 
 class Transport(abc.ABC):
     """Abstract base class for network transports."""
@@ -88,6 +269,13 @@ class Transport(abc.ABC):
     @abc.abstractmethod
     async def send(self, envelope: Envelope) -> None: ...
 
+    async def send_frame(self, frame: bytes) -> None:
+        """Send an already-encoded envelope.
+
+        Transports that write bytes should override this to skip the decode.
+        """
+        await self.send(Envelope.decode(frame))
+
     @abc.abstractmethod
     async def receive(self) -> Envelope: ...
 
@@ -119,6 +307,8 @@ class WebSocketTransport(Transport):
         self._backoff_base = backoff_base
         self._backoff_max = backoff_max
         self._closed = False
+        # Envelopes unpacked from a BUNDLE frame and not yet returned by receive().
+        self._inbox: deque[Envelope] = deque()
 
     @staticmethod
     async def _connect_with_retry(
@@ -136,7 +326,9 @@ class WebSocketTransport(Transport):
             except Exception:
                 if attempt >= retries:
                     raise
-                delay = min(backoff_base * (2**attempt), backoff_max)
+                # Clamp the exponent: the delay saturates at backoff_max long before,
+                # and an unbounded 2**attempt overflows float for large retry counts.
+                delay = min(backoff_base * (1 << min(attempt, 30)), backoff_max)
                 logger.warning(
                     "websocket connect failed (attempt=%s/%s); retrying in %.2fs",
                     attempt + 1,
@@ -208,23 +400,43 @@ class WebSocketTransport(Transport):
         return True
 
     async def send(self, envelope: Envelope) -> None:
+        await self.send_frame(envelope.encode())
+
+    async def send_frame(self, frame: bytes) -> None:
         if self._closed:
             raise RuntimeError("cannot send on closed websocket transport")
         try:
-            await self._ws.send(envelope.encode())
+            await self._ws.send(frame)
         except websockets.exceptions.ConnectionClosed as exc:
             self._closed = True
             raise ConnectionError("websocket send failed; connection closed") from exc
 
     async def receive(self) -> Envelope:
-        if self._closed:
-            raise RuntimeError("cannot receive on closed websocket transport")
-        try:
-            data = await self._ws.recv()
-        except websockets.exceptions.ConnectionClosed as exc:
-            self._closed = True
-            raise ConnectionError("websocket receive failed; connection closed") from exc
-        return Envelope.decode(bytes(data))
+        if self._inbox:
+            return self._inbox.popleft()
+        while True:
+            if self._closed:
+                raise RuntimeError("cannot receive on closed websocket transport")
+            try:
+                data = await self._ws.recv()
+            except websockets.exceptions.ConnectionClosed as exc:
+                self._closed = True
+                raise ConnectionError("websocket receive failed; connection closed") from exc
+            # Binary frames are decoded uncopied. Malformed frames (including
+            # text frames) are dropped here rather than surfacing as transport
+            # errors, which would make the receive loop reconnect.
+            try:
+                envelope = Envelope.decode(data)
+                if envelope.msg_type != MessageType.BUNDLE:
+                    return envelope
+                envelopes = envelope.unbundle()
+            except ValueError:
+                logger.warning("dropping malformed envelope from server")
+                continue
+            if envelopes:
+                self._inbox.extend(envelopes[1:])
+                return envelopes[0]
+            logger.warning("dropping empty bundle envelope from server")
 
     async def close(self) -> None:
         if not self._closed:
@@ -232,8 +444,59 @@ class WebSocketTransport(Transport):
             await self._ws.close()
 
 
+class _Outbox:
+    """Frames waiting to be written to one client connection."""
+
+    def __init__(self, limit: int = 4096) -> None:
+        self.frames: deque[bytes] = deque()
+        self.wake = anyio.Event()
+        self.limit = limit
+        self.overflowed = False
+
+    def put(self, frame: bytes) -> None:
+        if len(self.frames) >= self.limit:
+            self.overflowed = True
+        else:
+            self.frames.append(frame)
+        self.wake.set()
+
+    def take(self) -> list[bytes]:
+        """Pop queued frames up to the bundle size budget (always at least one)."""
+        frames = self.frames
+        taken = [frames.popleft()]
+        size = len(taken[0])
+        while frames and size + len(frames[0]) <= _MAX_BUNDLE_BYTES:
+            frame = frames.popleft()
+            taken.append(frame)
+            size += len(frame)
+        return taken
+
+
 class WebSocketServer:
-    """WebSocket server that accepts connections and broadcasts envelopes."""
+    """WebSocket server that accepts connections and broadcasts envelopes.
+
+    An envelope with ``target=None`` is relayed to every other joined client;
+    one with a target is delivered to that peer only (and dropped if it is not
+    connected). Earlier releases broadcast targeted envelopes to everyone too,
+    so clients must not rely on overhearing traffic addressed to other peers.
+
+    Relayed frames go through a per-connection outbox. A writer task sends
+    the backlog that builds up while a previous send is in flight as one
+    BUNDLE frame, so a burst costs one WebSocket write per client instead of
+    one per message, with no added latency when the link keeps up.
+
+    A client whose outbox exceeds ``max_outbox_frames`` or whose send stalls
+    for ``send_timeout`` seconds is disconnected rather than having updates
+    dropped: CRDT deltas depend on each other, and a reconnecting peer's JOIN
+    version vector lets the hub resend exactly what it missed.
+
+    ``reuse_port=True`` sets SO_REUSEPORT so several server processes can share
+    one port. Each process only relays between its own clients, so peers on
+    different processes need an external bus to see each other's updates.
+
+    ``port=0`` binds an ephemeral port; :attr:`port` holds the chosen one once
+    :meth:`start` returns (the first socket's, if ``host`` resolves to several).
+    """
 
     def __init__(
         self,
@@ -242,12 +505,19 @@ class WebSocketServer:
         *,
         auth_token: str | None = None,
         max_size: int | None = 10 * 1024 * 1024,
+        max_outbox_frames: int = 4096,
+        send_timeout: float | None = 30.0,
+        reuse_port: bool = False,
     ) -> None:
         self.host = host
         self.port = port
         self.auth_token = auth_token
         self.max_size = max_size
+        self.max_outbox_frames = max_outbox_frames
+        self.send_timeout = send_timeout
+        self.reuse_port = reuse_port
         self._clients: dict[int, Any] = {}  # peer_id -> websocket
+        self._outboxes: dict[Any, _Outbox] = {}  # websocket -> outbox
         self._clients_lock = anyio.Lock()
         self._on_message: Callable[[Envelope], Any] | None = None
         self._server: Any = None
@@ -255,6 +525,22 @@ class WebSocketServer:
     def on_message(self, callback: Callable[[Envelope], Any]) -> None:
         self._on_message = callback
 
+    async def send_to(self, peer_id: int, envelope: Envelope) -> bool:
+        """Send an envelope to one connected peer; returns False if it is not connected.
+
+        Served clients get the frame through their outbox, so it is ordered with
+        relayed frames and subject to the same backlog and send-timeout limits.
+        """
+        async with self._clients_lock:
+            ws = self._clients.get(peer_id)
+        if ws is None:
+            return False
+        outbox = self._outboxes.get(ws)
+        if outbox is None:
+            return False
+        outbox.put(envelope.encode())
+        return True
+
     async def _process_request(self, connection: Any, request: Request) -> Response | None:
         if self.auth_token is None:
             return None
@@ -290,48 +576,92 @@ class WebSocketServer:
         return None
 
     async def _handler(self, websocket: Any) -> None:
+        outbox = _Outbox(self.max_outbox_frames)
+        self._outboxes[websocket] = outbox
+        try:
+            async with anyio.create_task_group() as tg:
+                tg.start_soon(self._write_outbox, websocket, outbox)
+                await self._read_loop(websocket)
+                tg.cancel_scope.cancel()
+        finally:
+            self._outboxes.pop(websocket, None)
+
+    async def _write_outbox(self, websocket: Any, outbox: _Outbox) -> None:
+        while True:
+            await outbox.wake.wait()
+            outbox.wake = anyio.Event()
+            if outbox.overflowed:
+                logger.warning("closing client that fell %s frames behind", outbox.limit)
+                await self._drop_client(websocket)
+                await websocket.close(1013, "outbound backlog exceeded")
+                return
+            while outbox.frames:
+                frames = outbox.take()
+                frame = frames[0] if len(frames) == 1 else Envelope.bundle(frames).encode()
+                try:
+                    with anyio.move_on_after(self.send_timeout) as scope:
+                        await websocket.send(frame)
+                except Exception:
+                    logger.debug("dropping client after failed send", exc_info=True)
+                    await self._drop_client(websocket)
+                    return
+                if scope.cancel_called:
+                    logger.warning("closing client whose send stalled for %ss", self.send_timeout)
+                    await self._drop_client(websocket)
+                    await websocket.close(1013, "send timed out")
+                    return
+
+    async def _drop_client(self, websocket: Any) -> None:
+        async with self._clients_lock:
+            for cid, ws in list(self._clients.items()):
+                if ws is websocket:
+                    del self._clients[cid]
+
+    async def _read_loop(self, websocket: Any) -> None:
         peer_id: int | None = None
         authenticated_peer_id: int | None = getattr(websocket, "_plutus_authenticated_peer_id", None)
         try:
             async for message in websocket:
+                # Routing only needs the header; the full envelope is built
+                # just for the on_message callback.
                 try:
-                    envelope = Envelope.decode(bytes(message))
+                    msg_type, sender, target = Envelope.peek_header(message)
                 except ValueError:
                     logger.warning("dropping malformed envelope from client")
                     continue
-                if authenticated_peer_id is not None and envelope.sender != authenticated_peer_id:
+                if authenticated_peer_id is not None and sender != authenticated_peer_id:
                     logger.warning(
                         "dropping envelope with sender=%s for authenticated peer=%s",
-                        envelope.sender,
+                        sender,
                         authenticated_peer_id,
                     )
                     continue
-                if envelope.msg_type == MessageType.JOIN:
-                    peer_id = envelope.sender
+                if msg_type == MessageType.JOIN:
+                    peer_id = sender
                     async with self._clients_lock:
                         self._clients[peer_id] = websocket
                 if self._on_message:
-                    self._on_message(envelope)
-                # Broadcast to other clients
+                    self._on_message(Envelope.decode(message))
+                # Targeted envelopes go to their target only; the rest go to
+                # every other client. Each socket's writer task does the send.
                 async with self._clients_lock:
-                    recipients = [(cid, ws) for cid, ws in self._clients.items() if cid != envelope.sender]
-                stale_clients: list[int] = []
-                for cid, ws in recipients:
-                    if cid != envelope.sender:
-                        try:
-                            await ws.send(bytes(message))
-                        except Exception:
-                            stale_clients.append(cid)
-                if stale_clients:
-                    async with self._clients_lock:
-                        for cid in stale_clients:
-                            self._clients.pop(cid, None)
+                    if target is not None:
+                        target_ws = self._clients.get(target)
+                        recipients = [] if target_ws is None else [target_ws]
+                    else:
+                        recipients = [ws for cid, ws in self._clients.items() if cid != sender]
+                for ws in recipients:
+                    outbox = self._outboxes.get(ws)
+                    if outbox is not None:
+                        outbox.put(message)
         except websockets.exceptions.ConnectionClosed:
             pass
         finally:
             if peer_id is not None:
                 async with self._clients_lock:
-                    self._clients.pop(peer_id, None)
+                    # A reconnecting peer may already have registered a new socket.
+                    if self._clients.get(peer_id) is websocket:
+                        del self._clients[peer_id]
 
     async def start(self) -> None:
         self._server = await websockets.asyncio.server.serve(
@@ -340,7 +670,10 @@ class WebSocketServer:
             self.port,
             process_request=self._process_request,
             max_size=self.max_size,
+            reuse_port=self.reuse_port or None,
         )
+        if self.port == 0:
+            self.port = self._server.sockets[0].getsockname()[1]
 
     async def stop(self) -> None:
         async with self._clients_lock:
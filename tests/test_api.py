@@ -1,12 +1,18 @@
 """Tests for API module: lifecycle, agent, blueprint."""
 
+import asyncio
+
 import anyio
+import anyio.lowlevel
 import pytest
 
 from plutus.api.lifecycle import LifecycleEvent, LifecycleManager
 from plutus.api.agent import PlutusAgent
 from plutus.api.blueprint import Blueprint, BlueprintContext
 from plutus.core.document import PlutusDoc
+from plutus.core.types import Shard
+from plutus.net.broadcaster import DiffBroadcaster
+from plutus.net.transport import Transport
 
 
 class TestLifecycleManager:
@@ -40,6 +46,32 @@ class TestLifecycleManager:
         mgr.fire(LifecycleEvent.AFTER_JOIN)
         assert calls == ["joined"]
 
+    @pytest.mark.anyio
+    async def test_fire_async_awaits_coroutines_from_plain_callables(self):
+        mgr = LifecycleManager()
+        calls = []
+
+        async def record(tag):
+            calls.append(tag)
+
+        async def async_hook():
+            calls.append("async")
+
+        mgr.on(LifecycleEvent.AFTER_JOIN, async_hook)
+        mgr.on(LifecycleEvent.AFTER_JOIN, lambda: record("lambda"))
+        mgr.on(LifecycleEvent.AFTER_JOIN, lambda: calls.append("sync"))
+        await mgr.fire_async(LifecycleEvent.AFTER_JOIN)
+        assert calls == ["async", "lambda", "sync"]
+
+    def test_has_hooks(self):
+        mgr = LifecycleManager()
+        assert not mgr.has_hooks(LifecycleEvent.ON_STATE_CHANGE)
+        fn = lambda: None
+        mgr.on(LifecycleEvent.ON_STATE_CHANGE, fn)
+        assert mgr.has_hooks(LifecycleEvent.ON_STATE_CHANGE)
+        mgr.off(LifecycleEvent.ON_STATE_CHANGE, fn)
+        assert not mgr.has_hooks(LifecycleEvent.ON_STATE_CHANGE)
+
     def test_off(self):
         mgr = LifecycleManager()
         calls = []
@@ -94,6 +126,145 @@ class TestPlutusAgent:
         await agent.complete()
         assert not agent.is_joined
 
+    @pytest.mark.anyio
+    async def test_shard_callbacks_receive_committed_values(self):
+        agent = PlutusAgent(name="worker", peer_id=5)
+        received = []
+        agent.register_shard(Shard("tasks", ["task_"]), lambda k, v: received.append((k, v)))
+        await agent.join()
+
+        agent.state("tasks").set("task_1", {"status": "pending"})
+        agent.state("tasks").set("other", 1)
+        agent.commit()
+
+        assert received == [("task_1", {"status": "pending"})]
+        await agent.leave()
+
+    @pytest.mark.anyio
+    async def test_wait_for_update_wakes_on_change(self):
+        agent = PlutusAgent(name="worker", peer_id=7)
+        await agent.join()
+
+        agent.state("tasks").set("t1", "plan")
+        agent.commit()
+        await agent.wait_for_update(1)
+        with pytest.raises(TimeoutError):
+            await agent.wait_for_update(0.01)
+        await agent.leave()
+
+    @pytest.mark.anyio
+    async def test_wait_for_update_wakes_on_commit_from_worker_thread(self):
+        agent = PlutusAgent(name="worker", doc=PlutusDoc(peer_id=8, allow_multithreading=True))
+        await agent.join()
+
+        def write():
+            agent.state("tasks").set("t1", "plan")
+            agent.commit()
+
+        async with anyio.create_task_group() as tg:
+            tg.start_soon(agent.wait_for_update, 1)
+            await anyio.lowlevel.checkpoint()
+            await anyio.to_thread.run_sync(write)
+        await agent.leave()
+
+    @pytest.mark.anyio
+    async def test_sync_defers_on_full_queue_without_reconnecting(self):
+        class IdleTransport(Transport):
+            async def send(self, envelope):
+                pass
+
+            async def receive(self):
+                await anyio.sleep_forever()
+
+            async def close(self):
+                pass
+
+            @property
+            def is_connected(self):
+                return True
+
+        agent = PlutusAgent(name="worker", peer_id=9)
+        store = agent.doc.store
+        agent._transport = IdleTransport()
+        agent._broadcaster = DiffBroadcaster(store=store, transport=agent._transport, max_pending=1)
+        # Stand-in loop tasks keep sync() from starting a send_loop that would drain the queue.
+        agent._send_task = agent._receive_task = asyncio.get_running_loop().create_future()
+
+        async def no_reconnect():
+            raise AssertionError("backpressure must not reconnect")
+
+        agent._reconnect_transport = no_reconnect
+        assert agent._broadcaster.enqueue_update(b"filler")
+        watermark = agent._last_synced_vv
+
+        agent.state("tasks").set("t1", "plan")
+        await agent.sync()
+        assert agent._last_synced_vv == watermark
+
+        agent._broadcaster._pending.clear()
+        await agent.sync()
+        assert agent._last_synced_vv == store.clone_oplog_vv()
+        agent._send_task.cancel()
+
+    @pytest.mark.anyio
+    async def test_sync_resends_doc_commits_dropped_by_full_queue(self):
+        class IdleTransport(Transport):
+            async def send(self, envelope):
+                pass
+
+            async def receive(self):
+                await anyio.sleep_forever()
+
+            async def close(self):
+                pass
+
+            @property
+            def is_connected(self):
+                return True
+
+        agent = PlutusAgent(name="worker", peer_id=10)
+        store = agent.doc.store
+        agent._transport = IdleTransport()
+        agent._broadcaster = DiffBroadcaster(store=store, transport=agent._transport, max_pending=1)
+        agent._broadcaster.start_local_subscription()
+        agent._send_task = agent._receive_task = asyncio.get_running_loop().create_future()
+        assert agent._broadcaster.enqueue_update(b"filler")
+
+        # Bypasses agent.commit(), so only the dropped-update hook can flag it.
+        agent.state("tasks").set("t1", "plan")
+        agent.doc.commit()
+        agent._broadcaster._pending.clear()
+
+        await agent.sync()
+        assert agent._last_synced_vv == store.clone_oplog_vv()
+        assert len(agent._broadcaster._pending) == 1
+        agent._send_task.cancel()
+
+    def test_export_delta_only_ships_new_ops(self):
+        agent_a = PlutusAgent(name="a", peer_id=1)
+        agent_b = PlutusAgent(name="b", peer_id=2)
+
+        agent_a.state("tasks").set("t1", "plan")
+        agent_a.commit()
+        first = agent_a.export_delta()
+
+        agent_a.state("tasks").set("t2", "execute")
+        agent_a.commit()
+        second = agent_a.export_delta()
+
+        assert len(second) < len(agent_a.doc.export_updates())
+        agent_b.doc.import_updates(first)
+        agent_b.doc.import_updates(second)
+        assert agent_b.state("tasks").to_dict() == {"t1": "plan", "t2": "execute"}
+
+    def test_export_delta_does_not_advance_sync_watermark(self):
+        agent = PlutusAgent(name="a", peer_id=1)
+        watermark = agent._last_synced_vv
+        agent.state("tasks").set("t1", "plan")
+        agent.commit()
+        agent.export_delta()
+        assert agent._last_synced_vv == watermark
+
     @pytest.mark.anyio
     async def test_async_lifecycle_hooks_are_awaited(self):
         agent = PlutusAgent(name="worker", peer_id=11)
@@ -183,6 +354,37 @@ class TestBlueprint:
 
         assert doc.namespace("blueprint").get("data") == "shared_value"
 
+    @pytest.mark.anyio
+    async def test_node_writes_are_staged_until_node_exit(self):
+        doc = PlutusDoc()
+        seen = {}
+
+        def step(ctx: BlueprintContext):
+            ctx.set("count", 1)
+            ctx.set("count", 2)
+            seen["staged"] = ctx.get("count")
+            seen["namespace"] = doc.namespace("blueprint").get("count")
+
+        bp = Blueprint("batched")
+        bp.add_node("step", step)
+        await bp.execute(doc=doc)
+
+        assert seen == {"staged": 2, "namespace": None}
+        assert doc.namespace("blueprint").get("count") == 2
+
+    @pytest.mark.anyio
+    async def test_history_is_recorded_as_crdt_list(self):
+        doc = PlutusDoc()
+        bp = Blueprint("history")
+        bp.add_node("a", lambda ctx: None)
+        bp.add_node("b", lambda ctx: None)
+        bp.add_transition("a", "b")
+
+        ctx = await bp.execute(doc=doc)
+
+        assert ctx.history == ["a", "b"]
+        assert doc.get_deep_value()["blueprint"]["_history"] == ["a", "b"]
+
     def test_blueprint_nodes_and_transitions(self):
         bp = Blueprint("test")
         bp.add_node("a", lambda ctx: None)
@@ -1,9 +1,13 @@
 """Tests for core module: store, document, shard, decorators."""
 
+import threading
+from contextlib import nullcontext
+
 import anyio
+import anyio.lowlevel
 import pytest
 
-from plutus.core.store import CRDTStore
+from plutus.core.store import CRDTStore, decode_version_vector, is_decode_error
 from plutus.core.document import PlutusDoc
 from plutus.core.shard import ShardManager
 from plutus.core.types import Shard
@@ -47,6 +51,51 @@ class TestCRDTStore:
         assert deep["data"]["key_a"] == "value_a"
         assert deep["data"]["key_b"] == "value_b"
 
+    def test_export_updates_since_encoded_state_vector(self):
+        store_a = CRDTStore(peer_id=1)
+        store_b = CRDTStore(peer_id=2)
+        store_a.get_map("data").insert("old", "x" * 1000)
+        store_a.commit()
+        store_b.import_updates(store_a.export_updates())
+
+        store_a.get_map("data").insert("new", 1)
+        store_a.commit()
+        delta = store_a.export_updates(since=store_b.export_state_vector())
+        assert len(delta) < 500
+        store_b.import_updates(delta)
+        assert store_b.get_deep_value() == store_a.get_deep_value()
+        with pytest.raises(ValueError):
+            store_a.export_updates(since=b"garbage")
+
+    def test_merge_local_updates_is_bounded_to_the_batch(self):
+        store = CRDTStore(peer_id=1)
+        updates = []
+        store.on_local_update(lambda update: updates.append(update) or True)
+        for i in range(3):
+            store.get_map("tasks").insert(f"t{i}", i)
+            store.commit()
+        remote = CRDTStore(peer_id=2)
+        remote.get_map("tasks").insert("remote", 1)
+        remote.commit()
+        store.import_updates(remote.export_updates())
+        store.get_map("tasks").insert("later", 9)
+        store.commit()
+
+        replica = CRDTStore(peer_id=3)
+        replica.import_updates(store.merge_local_updates(updates[:3]))
+        assert replica.get_deep_value() == {"tasks": {"t0": 0, "t1": 1, "t2": 2}}
+
+    def test_undecodable_input_is_reported_consistently(self):
+        store = CRDTStore(peer_id=1)
+        with pytest.raises(ValueError):
+            store.import_updates(b"garbage")
+        with pytest.raises(ValueError):
+            decode_version_vector(b"\xff\xff\x01")
+        assert store.merge_local_updates([b"garbage", b"junk"]) is None
+        assert is_decode_error(BaseException("Decode error"))
+        assert not is_decode_error(KeyboardInterrupt())
+        assert not is_decode_error(RuntimeError())
+
     def test_snapshot_export_import(self):
         store_a = CRDTStore(peer_id=1)
         m = store_a.get_map("test")
@@ -101,6 +150,47 @@ class TestCRDTStore:
         store.commit()
         assert len(events) == 1
 
+    def test_container_handles_are_cached(self):
+        store = CRDTStore()
+        assert store.get_map("tasks") is store.get_map("tasks")
+        assert store.get_list("tasks") is store.get_list("tasks")
+        assert store.get_map("tasks") is not store.get_map("other")
+
+    def test_on_change_callback_can_commit(self):
+        store = CRDTStore()
+        m = store.get_map("test")
+
+        def mirror(_event):
+            if "copy" not in m:
+                m.insert("copy", m.get("k").value)
+                store.commit()
+
+        store.on_change(mirror)
+        m.insert("k", "v")
+        store.commit()
+        assert store.get_deep_value() == {"test": {"k": "v", "copy": "v"}}
+
+    def test_stores_lock_writes_unless_opted_out(self):
+        assert not isinstance(CRDTStore()._write_lock, nullcontext)
+        assert not isinstance(PlutusDoc().store._write_lock, nullcontext)
+        assert isinstance(CRDTStore(allow_multithreading=False)._write_lock, nullcontext)
+
+    def test_multithreaded_store_commits_from_threads(self):
+        store = CRDTStore()
+        counter = store.get_counter("hits")
+
+        def worker():
+            for _ in range(100):
+                counter.increment(1)
+                store.commit()
+
+        threads = [threading.Thread(target=worker) for _ in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert store.get_deep_value()["hits"] == 400
+
     @pytest.mark.anyio
     async def test_concurrent_writes(self):
         store = CRDTStore()
@@ -120,6 +210,52 @@ class TestCRDTStore:
         values = doc.namespace("tasks").to_dict()
         assert len(values) == 20
 
+    @pytest.mark.anyio
+    async def test_commit_soon_groups_concurrent_writers(self):
+        store = CRDTStore()
+        updates = []
+        store.on_local_update(lambda update: updates.append(update) or True)
+        doc = PlutusDoc(store=store)
+        ns = doc.namespace("tasks")
+
+        async def writer(prefix: str):
+            for i in range(10):
+                ns.set(f"{prefix}_{i}", i)
+                doc.commit_soon(0.01)
+                await anyio.lowlevel.checkpoint()
+
+        async with anyio.create_task_group() as tg:
+            tg.start_soon(writer, "a")
+            tg.start_soon(writer, "b")
+        await anyio.sleep(0.05)
+
+        assert len(updates) == 1
+        assert len(ns.to_dict()) == 20
+        ns.set("late", 1)
+        doc.commit_soon(max_pending_ops=1)
+        assert len(updates) == 2
+
+    def test_commit_soon_requires_running_loop(self):
+        doc = PlutusDoc()
+        doc.namespace("tasks").set("t1", 1)
+        with pytest.raises(RuntimeError, match="asyncio event loop"):
+            doc.commit_soon()
+
+    @pytest.mark.anyio
+    async def test_commit_from_worker_thread_cancels_scheduled_commit(self):
+        store = CRDTStore(allow_multithreading=True)
+        updates = []
+        store.on_local_update(lambda update: updates.append(update) or True)
+        store.get_map("tasks").insert("t1", 1)
+        store.commit_soon(0.01)
+        handle = store._commit_handle
+
+        await anyio.to_thread.run_sync(store.commit)
+        await anyio.lowlevel.checkpoint()
+        assert handle.cancelled()
+        assert store._commit_handle is None
+        assert len(updates) == 1
+
 
 class TestPlutusDoc:
     def test_namespace_crud(self):
@@ -151,6 +287,16 @@ class TestPlutusDoc:
         doc.commit()
         assert ns["x"] == 10
 
+    def test_namespace_iteration_returns_plain_values(self):
+        doc = PlutusDoc()
+        ns = doc.namespace("data")
+        ns["a"] = 1
+        ns["b"] = {"nested": True}
+        doc.commit()
+        assert sorted(ns) == ["a", "b"]
+        assert sorted(ns.keys()) == ["a", "b"]
+        assert sorted(ns.values(), key=str) == [1, {"nested": True}]
+
     def test_namespace_to_dict(self):
         doc = PlutusDoc()
         ns = doc.namespace("config")
@@ -164,6 +310,50 @@ class TestPlutusDoc:
         ns = doc.state("tasks")
         assert ns is doc.namespace("tasks")
 
+    def test_fork_from_diverges_and_merges_back(self):
+        base = PlutusDoc(peer_id=1)
+        base.namespace("tasks").set("t1", "plan")
+        base.commit()
+
+        for peer_id, shallow in ((2, False), (3, True)):
+            fork = PlutusDoc.fork_from(base, peer_id=peer_id, shallow=shallow)
+            assert fork.peer_id == peer_id
+            assert fork.namespace("tasks").get("t1") == "plan"
+
+            key = f"from_{peer_id}"
+            fork.namespace("tasks").set(key, "execute")
+            fork.commit()
+            assert key not in base.namespace("tasks")
+            base.import_updates(fork.export_updates(since=base.store.clone_oplog_vv()))
+            assert base.namespace("tasks").get(key) == "execute"
+
+    def test_state_fingerprint_tracks_convergence(self):
+        doc_a = PlutusDoc(peer_id=1)
+        doc_b = PlutusDoc(peer_id=2)
+        doc_a.namespace("data").set("a", 1)
+        doc_a.commit()
+        doc_b.namespace("data").set("b", 2)
+        doc_b.commit()
+        assert doc_a.state_fingerprint() != doc_b.state_fingerprint()
+
+        doc_a.import_updates(doc_b.export_updates())
+        doc_b.import_updates(doc_a.export_updates())
+        assert doc_a.state_fingerprint() == doc_b.state_fingerprint()
+        assert doc_a.get_deep_value() == doc_b.get_deep_value()
+
+    def test_iter_namespaces_streams_items(self):
+        doc = PlutusDoc()
+        doc.namespace("tasks").set("t1", {"status": "pending"})
+        doc.namespace("config").set("mode", "fast")
+        doc.store.get_text("notes").insert(0, "not a namespace")
+        doc.commit()
+
+        listed = {name: dict(ns.items()) for name, ns in doc.iter_namespaces()}
+        assert listed == {
+            "tasks": {"t1": {"status": "pending"}},
+            "config": {"mode": "fast"},
+        }
+
     def test_multiple_namespaces(self):
         doc = PlutusDoc()
         tasks = doc.namespace("tasks")
@@ -218,6 +408,33 @@ class TestShardManager:
         assert r1 == ["a_key"]
         assert r2 == ["b_key"]
 
+    def test_nested_prefixes_dispatch_in_registration_order(self):
+        mgr = ShardManager()
+        calls = []
+        mgr.register(Shard("long", ["task_urgent_"]), lambda k, v: calls.append("long"))
+        mgr.register(Shard("short", ["task_"]), lambda k, v: calls.append("short"))
+        mgr.register(Shard("empty", [""]), lambda k, v: calls.append("empty"))
+
+        mgr.dispatch("task_urgent_1", 1)
+        mgr.dispatch("task_2", 2)
+        mgr.dispatch("other", 3)
+
+        assert calls == ["long", "short", "empty", "short", "empty", "empty"]
+
+    def test_register_after_dispatch_refreshes_index(self):
+        mgr = ShardManager()
+        r1, r2 = [], []
+        mgr.register(Shard("s1", ["a_"]), lambda k, v: r1.append(k))
+        mgr.dispatch("a_key", 1)
+
+        mgr.register(Shard("s2", ["a_"]), lambda k, v: r2.append(k))
+        mgr.dispatch("a_key", 2)
+        mgr.unregister("s1")
+        mgr.dispatch("a_key", 3)
+
+        assert r1 == ["a_key", "a_key"]
+        assert r2 == ["a_key", "a_key"]
+
 
 class TestSyncedDescriptor:
     def test_synced_read_write(self):
@@ -274,3 +491,15 @@ class TestNamespaceValidation:
         ns.set("numbers", (1, 2, 3))
         doc.commit()
         assert ns.get("numbers") == [1, 2, 3]
+
+    def test_set_validates_nested_values_in_one_pass(self):
+        doc = PlutusDoc()
+        ns = doc.namespace("data")
+        with pytest.raises(TypeError):
+            ns.set("bad", {"ok": [1, 2], "nested": ({"x": object()},)})
+        with pytest.raises(TypeError):
+            ns.set("bad_key", {1: "int keys are not allowed"})
+
+        ns.set("good", {"pair": (1, (2, 3)), "flags": [True, None]})
+        doc.commit()
+        assert ns.get("good") == {"pair": [1, [2, 3]], "flags": [True, None]}
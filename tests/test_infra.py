@@ -1,10 +1,11 @@
 """Tests for infrastructure module: vfs, daemon."""
 
 import json
-import socket
+import subprocess
 import sys
 import tempfile
 import types
+from contextlib import asynccontextmanager
 from pathlib import Path
 
 import anyio
@@ -13,8 +14,9 @@ import pytest
 from plutus import PlutusAgent
 from plutus.core.store import CRDTStore
 from plutus.infra.daemon import SyncDaemon
-from plutus.infra.sandbox import E2BSandboxAdapter
+from plutus.infra.sandbox import E2BSandboxAdapter, LocalSandboxAdapter
 from plutus.infra.vfs import VirtualFilesystem
+from plutus.net.transport import Envelope, MessageType
 
 
 class TestVirtualFilesystem:
@@ -34,6 +36,43 @@ class TestVirtualFilesystem:
             data = json.loads(tasks_file.read_text())
             assert data == {"task_1": "plan", "task_2": "execute"}
 
+    def test_sync_to_disk_writes_raw_utf8(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            store = CRDTStore()
+            store.get_map("tasks").insert("task_1", "café")
+            store.commit()
+
+            VirtualFilesystem(store, tmpdir).sync_to_disk()
+            assert "café".encode() in (Path(tmpdir) / "tasks.json").read_bytes()
+
+    @pytest.mark.anyio
+    async def test_sync_to_disk_async(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            store = CRDTStore()
+            store.get_map("tasks").insert("task_1", "plan")
+            store.get_map("config").insert("mode", "fast")
+            store.commit()
+
+            await VirtualFilesystem(store, tmpdir).sync_to_disk_async()
+
+            assert json.loads((Path(tmpdir) / "tasks.json").read_text()) == {"task_1": "plan"}
+            assert json.loads((Path(tmpdir) / "config.json").read_text()) == {"mode": "fast"}
+
+    def test_sync_to_disk_leaves_no_temp_files(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            store = CRDTStore()
+            store.get_map("tasks").insert("task_1", "plan")
+            store.commit()
+
+            vfs = VirtualFilesystem(store, tmpdir)
+            vfs.sync_to_disk()
+            store.get_map("tasks").insert("task_1", "done")
+            store.commit()
+            vfs.sync_to_disk()
+
+            assert sorted(p.name for p in Path(tmpdir).iterdir()) == ["tasks.json"]
+            assert json.loads((Path(tmpdir) / "tasks.json").read_text()) == {"task_1": "done"}
+
     def test_sync_from_disk(self):
         with tempfile.TemporaryDirectory() as tmpdir:
             # Write JSON file
@@ -47,6 +86,22 @@ class TestVirtualFilesystem:
             m = store.get_map("config")
             assert m.get_deep_value() == {"timeout": 30, "retries": 3}
 
+    def test_sync_from_disk_skips_unchanged_keys(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            store = CRDTStore()
+            store.get_map("config").insert("timeout", 30)
+            store.commit()
+            vfs = VirtualFilesystem(store, tmpdir)
+            vfs.sync_to_disk()
+            vv_before = store.clone_oplog_vv()
+
+            vfs.sync_from_disk()
+            assert store.clone_oplog_vv() == vv_before
+
+            (Path(tmpdir) / "config.json").write_text(json.dumps({"timeout": 60}))
+            vfs.sync_from_disk()
+            assert store.get_map("config").get_deep_value() == {"timeout": 60}
+
     def test_snapshot_roundtrip(self):
         with tempfile.TemporaryDirectory() as tmpdir:
             store_a = CRDTStore(peer_id=1)
@@ -63,6 +118,30 @@ class TestVirtualFilesystem:
 
             assert store_b.get_map("data").get_deep_value() == {"key": "value"}
 
+    def test_incremental_snapshot_chain(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            store_a = CRDTStore(peer_id=1)
+            data = store_a.get_map("data")
+            data.insert("blob", "".join(str(i) for i in range(2000)))
+            store_a.commit()
+            vfs_a = VirtualFilesystem(store_a, tmpdir)
+            base = vfs_a.write_snapshot()
+
+            data.insert("k1", 1)
+            store_a.commit()
+            first = vfs_a.write_snapshot(Path(tmpdir) / "snapshot.1.bin", base=base)
+            data.insert("k2", 2)
+            store_a.commit()
+            second = vfs_a.write_snapshot(Path(tmpdir) / "snapshot.2.bin", base=first)
+            assert second.stat().st_size < base.stat().st_size / 10
+
+            store_b = CRDTStore(peer_id=2)
+            VirtualFilesystem(store_b, tmpdir).load_snapshot(second)
+            assert store_b.get_deep_value() == store_a.get_deep_value()
+
+            with pytest.raises(ValueError):
+                vfs_a.write_snapshot(base, base=base)
+
     def test_sync_from_disk_malformed_json_is_skipped(self):
         with tempfile.TemporaryDirectory() as tmpdir:
             bad_file = Path(tmpdir) / "bad.json"
@@ -73,45 +152,146 @@ class TestVirtualFilesystem:
             assert store.get_deep_value() == {}
 
 
-def _free_port() -> int:
-    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    sock.bind(("127.0.0.1", 0))
-    port = sock.getsockname()[1]
-    sock.close()
-    return port
+@asynccontextmanager
+async def running_daemon(*peer_ids):
+    """Yield ``(daemon, uri, agents)``, leaving every agent and stopping the daemon on exit."""
+    daemon = SyncDaemon(host="127.0.0.1", port=0)
+    await daemon.start()
+    agents = [PlutusAgent(name=f"agent-{peer_id}", peer_id=peer_id) for peer_id in peer_ids]
+    try:
+        yield daemon, f"ws://127.0.0.1:{daemon.port}", agents
+    finally:
+        for agent in agents:
+            await agent.leave()
+        await daemon.stop()
 
 
 class TestSyncDaemonIntegration:
     @pytest.mark.anyio
     async def test_agents_auto_sync_without_manual_import(self):
-        port = _free_port()
-        daemon = SyncDaemon(port=port)
-        await daemon.start()
-
-        agent_a = PlutusAgent(name="a", peer_id=101)
-        agent_b = PlutusAgent(name="b", peer_id=202)
-        uri = f"ws://localhost:{port}"
-
-        try:
+        async with running_daemon(101, 202) as (_, uri, (agent_a, agent_b)):
             await agent_a.join(server_uri=uri)
             await agent_b.join(server_uri=uri)
 
             agent_a.state("shared").set("from_a", "hello")
             agent_a.commit()
 
-            with anyio.fail_after(2):
-                while agent_b.state("shared").get("from_a") != "hello":
-                    await anyio.sleep(0.05)
+            while agent_b.state("shared").get("from_a") != "hello":
+                await agent_b.wait_for_update(2)
 
             agent_b.state("shared").set("from_b", "world")
             agent_b.commit()
+            while agent_a.state("shared").get("from_b") != "world":
+                await agent_a.wait_for_update(2)
+
+    def test_daemon_imports_queued_updates_in_batches(self):
+        daemon = SyncDaemon(port=0, max_import_batch=2)
+        updates = []
+        for peer_id in (11, 12, 13):
+            store = CRDTStore(peer_id=peer_id)
+            store.get_map("shared").insert(f"k{peer_id}", peer_id)
+            store.commit()
+            updates.append(store.export_updates())
+
+        for i, update in enumerate([*updates, b"not-a-loro-update"]):
+            daemon._handle_message(
+                Envelope(msg_type=MessageType.CRDT_UPDATE, sender=i, target=None, payload=update)
+            )
+        assert daemon.store.get_deep_value() == {}
+
+        daemon._import_pending()
+        assert daemon.store.get_deep_value() == {"shared": {"k11": 11, "k12": 12, "k13": 13}}
+        assert len(daemon.event_log) == 3
+
+    @pytest.mark.anyio
+    async def test_reconnect_keeps_broadcaster_tasks(self):
+        async with running_daemon(303, 404) as (_, uri, (agent_a, agent_b)):
+            await agent_a.join(server_uri=uri)
+            await agent_b.join(server_uri=uri)
+            tasks = (agent_a._receive_task, agent_a._send_task)
+
+            assert await agent_a._reconnect_transport()
+            assert (agent_a._receive_task, agent_a._send_task) == tasks
+
+            agent_b.state("shared").set("from_b", "after-reconnect")
+            agent_b.commit()
+            while agent_a.state("shared").get("from_b") != "after-reconnect":
+                await agent_a.wait_for_update(2)
+
+    @pytest.mark.anyio
+    async def test_late_joiner_receives_missing_delta(self):
+        async with running_daemon(707, 808) as (daemon, uri, (agent_a, agent_b)):
+            await agent_a.join(server_uri=uri)
+            agent_a.state("shared").set("early", "before-b-joined")
+            await agent_a.sync()
             with anyio.fail_after(2):
-                while agent_a.state("shared").get("from_b") != "world":
+                while daemon.store.get_deep_value().get("shared") is None:
                     await anyio.sleep(0.05)
+
+            await agent_b.join(server_uri=uri)
+            while agent_b.state("shared").get("early") != "before-b-joined":
+                await agent_b.wait_for_update(2)
+            assert daemon.peers.get_peer(808).last_ack_vv is not None
+
+    @pytest.mark.anyio
+    async def test_sync_skips_idle_ticks(self, monkeypatch):
+        async with running_daemon(505, 606) as (_, uri, (agent_a, agent_b)):
+            await agent_a.join(server_uri=uri)
+            await agent_b.join(server_uri=uri)
+
+            agent_a.state("shared").set("from_a", "synced")
+            await agent_a.sync()
+            while agent_b.state("shared").get("from_a") != "synced":
+                await agent_b.wait_for_update(2)
+
+            exports = []
+            store = agent_a.doc.store
+            original = store.export_updates_with_vv
+            monkeypatch.setattr(
+                store, "export_updates_with_vv", lambda since: exports.append(1) or original(since)
+            )
+            await agent_a.sync()
+            assert exports == []
+
+
+class TestLocalSandboxAdapter:
+    @pytest.mark.anyio
+    async def test_persistent_shell_isolates_commands(self, tmp_path):
+        adapter = LocalSandboxAdapter(str(tmp_path), persistent_shell=True)
+        await adapter.start()
+        try:
+            assert await adapter.exec("echo one; printf two") == "one\ntwo"
+            assert await adapter.exec("cd / && export X=1; exit 0") == ""
+            assert await adapter.exec("pwd; echo ${X:-unset}") == f"{tmp_path}\nunset\n"
+            with pytest.raises(subprocess.CalledProcessError) as excinfo:
+                await adapter.exec("echo partial; exit 3")
+            assert excinfo.value.returncode == 3
+            with pytest.raises(subprocess.CalledProcessError):
+                await adapter.exec("if then")
+            assert await adapter.exec("echo still alive") == "still alive\n"
+        finally:
+            await adapter.stop()
+
+    @pytest.mark.anyio
+    async def test_cancelled_exec_does_not_leak_into_next_call(self, tmp_path):
+        adapter = LocalSandboxAdapter(str(tmp_path), persistent_shell=True)
+        await adapter.start()
+        try:
+            with anyio.move_on_after(0.05):
+                await adapter.exec("echo stale; sleep 0.1; echo late > late.txt")
+            assert await adapter.exec("echo fresh") == "fresh\n"
+            await anyio.sleep(0.15)
+            assert not (tmp_path / "late.txt").exists()
         finally:
-            await agent_a.leave()
-            await agent_b.leave()
-            await daemon.stop()
+            await adapter.stop()
+
+    @pytest.mark.anyio
+    async def test_write_file_accepts_bytes(self, tmp_path):
+        adapter = LocalSandboxAdapter(str(tmp_path))
+        await adapter.write_file("blob.bin", b"\x00\xff\x80")
+        await adapter.write_file("note.txt", "text")
+        assert (tmp_path / "blob.bin").read_bytes() == b"\x00\xff\x80"
+        assert await adapter.read_file("note.txt") == "text"
 
 
 class TestE2BSandboxAdapter:
@@ -1,11 +1,22 @@
 """Tests for network module: transport, event_log, broadcaster, peer."""
 
+import socket
 import tempfile
 from pathlib import Path
 
+import anyio
 import pytest
 
-from plutus.net.transport import Envelope, MessageType
+from plutus.net.transport import (
+    Envelope,
+    EnvelopeFlags,
+    MessageType,
+    Transport,
+    WebSocketServer,
+    WebSocketTransport,
+    _Outbox,
+)
+from plutus.net import event_log
 from plutus.net.event_log import EventLog
 from plutus.net.peer import PeerManager
 from plutus.core.store import CRDTStore
@@ -28,6 +39,13 @@ class TestEnvelope:
         assert decoded.target is None
         assert decoded.payload == b"hello world"
 
+    def test_encode_reuses_frame(self):
+        env = Envelope(msg_type=MessageType.CRDT_UPDATE, sender=1, target=None, payload=b"x")
+        frame = env.encode()
+        assert env.encode() is frame
+        assert Envelope.decode(frame).encode() is frame
+        assert Envelope.decode(frame) == env
+
     def test_roundtrip_with_target(self):
         env = Envelope(
             msg_type=MessageType.HEARTBEAT,
@@ -49,6 +67,75 @@ class TestEnvelope:
         with pytest.raises(ValueError):
             Envelope.decode(b"not-msgpack")
 
+    def test_batch_roundtrip(self):
+        env = Envelope.batch(7, [b"one", b"two"])
+        decoded = Envelope.decode(env.encode())
+        assert decoded.msg_type == MessageType.BATCH
+        assert decoded.update_payloads() == [b"one", b"two"]
+
+    def test_memoryview_payload_roundtrip(self):
+        env = Envelope(MessageType.CRDT_UPDATE, sender=1, target=None, payload=memoryview(b"crdt"))
+        decoded = Envelope.decode(memoryview(env.encode()))
+        assert decoded.payload == b"crdt"
+        assert env.update_payloads() == [b"crdt"]
+
+    def test_large_payload_is_compressed(self):
+        payload = b"task-state " * 1024
+        env = Envelope(MessageType.CRDT_UPDATE, sender=1, target=None, payload=payload)
+        compressed = env.compressed(threshold=4096)
+        assert compressed.flags & EnvelopeFlags.COMPRESSED
+        assert len(compressed.encode()) < len(env.encode())
+        assert Envelope.decode(compressed.encode()).update_payloads() == [payload]
+        assert env.compressed(threshold=len(payload) + 1) is env
+
+    def test_decode_accepts_legacy_msgpack_frames(self):
+        from plutus._util.serialization import pack
+
+        legacy = pack({"v": 1, "t": 1, "s": 3, "r": None, "p": b"crdt"})
+        env = Envelope.decode(legacy)
+        assert (env.msg_type, env.sender, env.target, env.payload) == (MessageType.CRDT_UPDATE, 3, None, b"crdt")
+
+    def test_binary_header_roundtrip_and_validation(self):
+        env = Envelope(MessageType.CRDT_UPDATE, sender=2**64 - 1, target=0, payload=b"abc", flags=1)
+        frame = env.encode()
+        assert Envelope.decode(frame) == env
+        with pytest.raises(ValueError):
+            Envelope.decode(frame[:-1])
+        with pytest.raises(ValueError):
+            Envelope.decode(frame[:10])
+        with pytest.raises(ValueError):
+            Envelope(MessageType.JOIN, sender=-1, target=None, payload=b"").encode()
+
+    def test_decode_rejects_unknown_message_type(self):
+        frame = bytearray(Envelope(MessageType.JOIN, sender=1, target=None, payload=b"").encode())
+        frame[2] = 99
+        with pytest.raises(ValueError):
+            Envelope.decode(bytes(frame))
+
+    def test_decode_rejects_non_map_legacy_frames_before_unpacking(self):
+        from plutus._util.serialization import pack
+
+        for data in (b"", pack([b"x"] * 1000), pack("text")):
+            with pytest.raises(ValueError):
+                Envelope.decode(data)
+
+    def test_text_frames_are_rejected_as_malformed(self):
+        for text in ("hello", ""):
+            with pytest.raises(ValueError):
+                Envelope.decode(text)
+            with pytest.raises(ValueError):
+                Envelope.peek_header(text)
+
+    def test_peek_header(self):
+        from plutus._util.serialization import pack
+
+        frame = Envelope(MessageType.JOIN, sender=5, target=9, payload=b"vv").encode()
+        assert Envelope.peek_header(frame) == (MessageType.JOIN, 5, 9)
+        legacy = pack({"t": 1, "s": 3, "r": None, "p": b""})
+        assert Envelope.peek_header(legacy) == (MessageType.CRDT_UPDATE, 3, None)
+        with pytest.raises(ValueError):
+            Envelope.peek_header(frame + b"extra")
+
     def test_decode_rejects_missing_fields(self):
         from plutus._util.serialization import pack
 
@@ -68,6 +155,16 @@ class TestEventLog:
         assert entries[0] == b"entry1"
         assert entries[2] == b"entry3"
 
+    def test_on_disk_records_use_big_endian_length_prefix(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = Path(tmpdir) / "log.bin"
+            path.write_bytes(b"\x00\x00\x00\x02ok\x00\x00\x00\x03new")
+            log = EventLog(path)
+            assert list(log.replay()) == [b"ok", b"new"]
+            log.append(b"more")
+            log.close()
+            assert path.read_bytes().endswith(b"\x00\x00\x00\x04more")
+
     def test_len_and_getitem(self):
         log = EventLog()
         log.append(b"a")
@@ -89,6 +186,55 @@ class TestEventLog:
             assert entries[0] == b"data1"
             assert entries[1] == b"data2"
 
+    def test_append_many_persists_in_order(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = Path(tmpdir) / "log.bin"
+            log1 = EventLog(path)
+            log1.append(b"first")
+            log1.append_many([b"second", b"third"])
+
+            assert list(EventLog(path).replay()) == [b"first", b"second", b"third"]
+
+    def test_load_ignores_empty_file_and_truncated_tail(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = Path(tmpdir) / "log.bin"
+            path.write_bytes(b"")
+            assert list(EventLog(path).replay()) == []
+            path.write_bytes(b"\x00\x00\x00\x02ok\x00\x00\x00\x09cut")
+            assert list(EventLog(path).replay()) == [b"ok"]
+
+    def test_flush_bytes_holds_records_until_flush(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = Path(tmpdir) / "log.bin"
+            log = EventLog(path, flush_bytes=1024)
+            log.append(b"one")
+            log.append_many([b"two", b"three"])
+            assert list(log.replay()) == [b"one", b"two", b"three"]
+            assert list(EventLog(path).replay()) == []
+
+            log.flush()
+            assert list(EventLog(path).replay()) == [b"one", b"two", b"three"]
+            log.append(b"four")
+            log.close()
+            assert list(EventLog(path).replay()) == [b"one", b"two", b"three", b"four"]
+
+    def test_flush_spans_several_writev_batches(self, monkeypatch):
+        monkeypatch.setattr(event_log, "_IOV_MAX", 3)
+        entries = [bytes([i]) * i for i in range(1, 20)]
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = Path(tmpdir) / "log.bin"
+            log = EventLog(path, flush_bytes=1 << 20)
+            log.append_many(entries)
+            log.close()
+            assert list(EventLog(path).replay()) == entries
+
+    def test_append_while_replaying(self):
+        log = EventLog()
+        log.append(b"a")
+        for entry in log.replay():
+            log.append(entry + b"!")
+        assert list(log.replay()) == [b"a", b"a!"]
+
     def test_retention_max_entries(self):
         log = EventLog(max_entries=2)
         log.append(b"a")
@@ -96,6 +242,31 @@ class TestEventLog:
         log.append(b"c")
         assert list(log.replay()) == [b"b", b"c"]
 
+    def test_retention_persists_only_retained_entries(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = Path(tmpdir) / "log.bin"
+            log = EventLog(path, max_entries=2)
+            log.append(b"a")
+            log.append(b"b")
+            assert list(EventLog(path).replay()) == [b"a", b"b"]
+            log.append_many([b"c", b"d"])
+            log.append(b"e")
+            assert list(EventLog(path).replay()) == [b"d", b"e"]
+            assert log[0] == b"d"
+
+    def test_retention_defers_rewrite_until_dead_prefix_dominates(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = Path(tmpdir) / "log.bin"
+            log = EventLog(path, max_entries=4)
+            log.append_many([b"a", b"b", b"c", b"d"])
+            log.append(b"e")
+            # The evicted record is still on disk but skipped on reload.
+            assert len(list(EventLog(path).replay())) == 5
+            assert list(EventLog(path, max_entries=4).replay()) == [b"b", b"c", b"d", b"e"]
+            for entry in (b"f", b"g", b"h", b"i"):
+                log.append(entry)
+            assert list(EventLog(path).replay()) == [b"f", b"g", b"h", b"i"]
+
     def test_compact_clears_history(self):
         log = EventLog()
         log.append(b"one")
@@ -132,6 +303,16 @@ class TestPeerManager:
         assert 1 in pruned
         assert mgr.peer_count == 0
 
+    def test_heartbeat_refreshes_peer_and_ignores_unknown(self):
+        mgr = PeerManager(heartbeat_timeout=0.05)
+        mgr.add_peer(1)
+        mgr.get_peer(1).last_heartbeat -= 1
+        assert mgr.stale_peers() == [1]
+        mgr.record_heartbeat(1)
+        mgr.record_heartbeat(99)
+        assert mgr.stale_peers() == []
+        assert mgr.peer_ids == [1]
+
     def test_peer_metadata(self):
         mgr = PeerManager()
         info = mgr.add_peer(1, metadata={"name": "agent_1"})
@@ -162,3 +343,306 @@ class TestBroadcasterSync:
         store_b.import_updates(envelope.payload)
 
         assert store_b.get_map("data").get_deep_value() == {"from_a": "hello"}
+
+    def test_replay_log_skips_bad_entries(self):
+        store_a = CRDTStore(peer_id=1)
+        log = EventLog()
+        DiffBroadcaster(store=store_a, event_log=log).start_local_subscription()
+        store_a.get_map("data").insert("k1", 1)
+        store_a.commit()
+        log.append(Envelope(msg_type=MessageType.CRDT_UPDATE, sender=3, target=None, payload=b"junk").encode())
+        store_a.get_map("data").insert("k2", 2)
+        store_a.commit()
+
+        store_b = CRDTStore(peer_id=2)
+        DiffBroadcaster(store=store_b, event_log=log).replay_log()
+        assert store_b.get_map("data").get_deep_value() == {"k1": 1, "k2": 2}
+
+
+class RecordingTransport(Transport):
+    def __init__(self):
+        self.sent = []
+
+    async def send(self, envelope):
+        self.sent.append(envelope)
+
+    async def receive(self):
+        await anyio.sleep_forever()
+
+    async def close(self):
+        pass
+
+    @property
+    def is_connected(self):
+        return True
+
+
+class TestBroadcasterBatching:
+    @pytest.mark.anyio
+    async def test_send_loop_coalesces_queued_updates(self):
+        store = CRDTStore(peer_id=1)
+        transport = RecordingTransport()
+        broadcaster = DiffBroadcaster(store=store, transport=transport)
+        for payload in (b"a", b"b", b"c"):
+            broadcaster.enqueue_update(payload)
+
+        async with anyio.create_task_group() as tg:
+            await tg.start(broadcaster.send_loop)
+            assert await broadcaster.flush_pending(timeout=1.0)
+            broadcaster.stop()
+
+        assert len(transport.sent) == 1
+        assert transport.sent[0].msg_type == MessageType.BATCH
+        assert transport.sent[0].update_payloads() == [b"a", b"b", b"c"]
+
+    @pytest.mark.anyio
+    async def test_send_loop_merges_local_loro_updates(self):
+        store = CRDTStore(peer_id=1)
+        transport = RecordingTransport()
+        broadcaster = DiffBroadcaster(store=store, transport=transport)
+        broadcaster.start_local_subscription()
+        for i in range(5):
+            store.get_map("tasks").insert(f"t{i}", i)
+            store.commit()
+
+        async with anyio.create_task_group() as tg:
+            await tg.start(broadcaster.send_loop)
+            assert await broadcaster.flush(timeout=1.0)
+            broadcaster.stop()
+
+        assert len(transport.sent) == 1
+        assert transport.sent[0].msg_type == MessageType.CRDT_UPDATE
+        replica = CRDTStore(peer_id=2)
+        replica.import_batch(transport.sent[0].update_payloads())
+        assert replica.get_deep_value() == {"tasks": {f"t{i}": i for i in range(5)}}
+
+    @pytest.mark.anyio
+    async def test_flush_waits_for_send_loop(self):
+        store = CRDTStore(peer_id=1)
+        transport = RecordingTransport()
+        broadcaster = DiffBroadcaster(store=store, transport=transport)
+        assert await broadcaster.flush(timeout=0.01)
+
+        broadcaster.enqueue_update(b"a")
+        assert not await broadcaster.flush(timeout=0.01)
+
+        async with anyio.create_task_group() as tg:
+            await tg.start(broadcaster.send_loop)
+            assert await broadcaster.flush(timeout=1.0)
+            broadcaster.stop()
+
+        assert [env.payload for env in transport.sent] == [b"a"]
+
+    @pytest.mark.anyio
+    async def test_failed_send_requeues_batch(self):
+        class FlakyTransport(RecordingTransport):
+            fail = True
+
+            async def send(self, envelope):
+                if self.fail:
+                    raise ConnectionError("gone")
+                self.sent.append(envelope)
+
+        transport = FlakyTransport()
+        log = EventLog()
+        broadcaster = DiffBroadcaster(store=CRDTStore(peer_id=1), transport=transport, event_log=log)
+        broadcaster.enqueue_update(b"a")
+        broadcaster.enqueue_update(b"b")
+
+        await broadcaster.send_loop()
+        assert transport.sent == [] and len(log) == 0
+
+        transport.fail = False
+        async with anyio.create_task_group() as tg:
+            await tg.start(broadcaster.send_loop)
+            assert await broadcaster.flush(timeout=1.0)
+            broadcaster.stop()
+
+        assert transport.sent[0].update_payloads() == [b"a", b"b"]
+        assert len(log) == 1
+
+    @pytest.mark.anyio
+    async def test_sent_frames_are_logged_once_queue_drains(self):
+        class CountingLog(EventLog):
+            writes = 0
+
+            def append_many(self, entries):
+                CountingLog.writes += 1
+                super().append_many(entries)
+
+        log = CountingLog()
+        broadcaster = DiffBroadcaster(
+            store=CRDTStore(peer_id=1), transport=RecordingTransport(), event_log=log, max_batch=1
+        )
+        for payload in (b"a", b"b", b"c"):
+            broadcaster.enqueue_update(payload)
+
+        async with anyio.create_task_group() as tg:
+            await tg.start(broadcaster.send_loop)
+            assert await broadcaster.flush(timeout=1.0)
+            broadcaster.stop()
+
+        assert [Envelope.decode(entry).payload for entry in log.replay()] == [b"a", b"b", b"c"]
+        assert CountingLog.writes == 1
+
+
+class TestServerFanout:
+    @pytest.mark.anyio
+    async def test_server_relays_broadcasts_to_all_and_targeted_to_target_only(self):
+        server = WebSocketServer("127.0.0.1", 0)
+        await server.start()
+        uri = f"ws://127.0.0.1:{server.port}"
+        clients = {pid: await WebSocketTransport.connect(uri, peer_id=pid) for pid in (1, 2, 3)}
+        try:
+            for pid, client in clients.items():
+                await client.send(Envelope(MessageType.JOIN, sender=pid, target=None, payload=b""))
+            with anyio.fail_after(2):
+                while server.client_count < 3:
+                    await anyio.sleep(0.01)
+
+            async def next_update(client):
+                while (envelope := await client.receive()).msg_type != MessageType.CRDT_UPDATE:
+                    pass
+                return envelope.payload
+
+            await clients[1].send(Envelope(MessageType.CRDT_UPDATE, sender=1, target=3, payload=b"direct"))
+            await clients[1].send(Envelope(MessageType.CRDT_UPDATE, sender=1, target=None, payload=b"all"))
+            with anyio.fail_after(2):
+                # Peer 2 sees only the broadcast; peer 3 sees both, in order.
+                assert await next_update(clients[2]) == b"all"
+                assert await next_update(clients[3]) == b"direct"
+                assert await next_update(clients[3]) == b"all"
+        finally:
+            for client in clients.values():
+                await client.close()
+            await server.stop()
+
+    @pytest.mark.anyio
+    async def test_send_to_queues_on_client_outbox(self):
+        class DirectSocket:
+            async def send(self, frame):
+                raise AssertionError("served clients must be written by their outbox task")
+
+        server = WebSocketServer("127.0.0.1", 0)
+        ws = DirectSocket()
+        outbox = _Outbox(server.max_outbox_frames)
+        server._clients[7] = ws
+        server._outboxes[ws] = outbox
+        envelope = Envelope(MessageType.CRDT_UPDATE, sender=1, target=7, payload=b"catch-up")
+
+        assert await server.send_to(7, envelope)
+        assert not await server.send_to(8, envelope)
+        assert list(outbox.frames) == [envelope.encode()]
+
+    @pytest.mark.anyio
+    @pytest.mark.skipif(not hasattr(socket, "SO_REUSEPORT"), reason="SO_REUSEPORT unavailable")
+    async def test_reuse_port_lets_servers_share_a_port(self):
+        first = WebSocketServer("127.0.0.1", 0, reuse_port=True)
+        await first.start()
+        second = WebSocketServer("127.0.0.1", first.port, reuse_port=True)
+        try:
+            await second.start()
+        finally:
+            await second.stop()
+            await first.stop()
+
+
+class TestBundling:
+    @pytest.mark.anyio
+    async def test_transport_unpacks_bundles_in_order(self):
+        frames = [
+            Envelope(MessageType.CRDT_UPDATE, sender=i, target=None, payload=bytes([i])).encode() for i in (1, 2, 3)
+        ]
+
+        class FakeSocket:
+            def __init__(self):
+                self.incoming = [Envelope.bundle(frames[:2]).encode(), frames[2]]
+
+            async def recv(self):
+                return self.incoming.pop(0)
+
+        transport = WebSocketTransport(FakeSocket(), uri="ws://test")
+        received = [await transport.receive() for _ in range(3)]
+        assert [env.sender for env in received] == [1, 2, 3]
+        assert [env.payload for env in received] == [b"\x01", b"\x02", b"\x03"]
+
+    @pytest.mark.anyio
+    async def test_transport_skips_text_and_malformed_frames(self):
+        frame = Envelope(MessageType.CRDT_UPDATE, sender=4, target=None, payload=b"ok").encode()
+
+        class FakeSocket:
+            def __init__(self):
+                self.incoming = ["hello", b"junk", Envelope.bundle([]).encode(), frame]
+
+            async def recv(self):
+                return self.incoming.pop(0)
+
+        transport = WebSocketTransport(FakeSocket(), uri="ws://test")
+        assert (await transport.receive()).payload == b"ok"
+
+    @pytest.mark.anyio
+    async def test_server_bundles_backlog_per_client(self):
+        class SlowSocket:
+            def __init__(self):
+                self.frames = []
+
+            async def send(self, frame):
+                await anyio.sleep(0.01)
+                self.frames.append(frame)
+
+        server = WebSocketServer()
+        ws = SlowSocket()
+        outbox = server._outboxes[ws] = _Outbox()
+        frames = [Envelope(MessageType.CRDT_UPDATE, sender=1, target=None, payload=bytes([i])).encode() for i in range(4)]
+
+        async with anyio.create_task_group() as tg:
+            tg.start_soon(server._write_outbox, ws, outbox)
+            outbox.put(frames[0])
+            await anyio.sleep(0.001)
+            for frame in frames[1:]:
+                outbox.put(frame)
+            await anyio.sleep(0.05)
+            tg.cancel_scope.cancel()
+
+        assert ws.frames[0] == frames[0]
+        assert [env.encode() for env in Envelope.decode(ws.frames[1]).unbundle()] == frames[1:]
+
+    @pytest.mark.anyio
+    async def test_server_disconnects_stalled_or_backlogged_clients(self):
+        class StuckSocket:
+            def __init__(self):
+                self.close_code = None
+
+            async def send(self, frame):
+                await anyio.sleep_forever()
+
+            async def close(self, code=1000, reason=""):
+                self.close_code = code
+
+        frame = Envelope(MessageType.CRDT_UPDATE, sender=1, target=None, payload=b"x").encode()
+        server = WebSocketServer(send_timeout=0.01, max_outbox_frames=2)
+        stalled, backlogged = StuckSocket(), StuckSocket()
+        server._clients.update({2: stalled, 3: backlogged})
+
+        stalled_box = _Outbox(server.max_outbox_frames)
+        stalled_box.put(frame)
+        await server._write_outbox(stalled, stalled_box)
+
+        backlog_box = _Outbox(server.max_outbox_frames)
+        for _ in range(3):
+            backlog_box.put(frame)
+        await server._write_outbox(backlogged, backlog_box)
+
+        assert stalled.close_code == backlogged.close_code == 1013
+        assert server.client_count == 0
+
+
+class TestBroadcasterQueue:
+    def test_enqueue_respects_capacity_and_stop(self):
+        broadcaster = DiffBroadcaster(store=CRDTStore(peer_id=1), transport=RecordingTransport(), max_pending=2)
+        assert broadcaster.enqueue_update(b"a")
+        assert broadcaster.enqueue_update(b"b")
+        assert not broadcaster.enqueue_update(b"c")
+
+        broadcaster.stop()
+        assert not broadcaster.enqueue_update(b"d")